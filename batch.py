@@ -0,0 +1,387 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Headless batch processing of a video file or an image directory.
+
+python batch.py nightly.avi PedestrianProcessor -o annotated.avi
+python batch.py shots/ BGRVelviaCurveFilter StrokeEdgesFilter --frames out/
+python batch.py nightly.avi CirclesProcessor -p maxRadius=40 -j 4 --results circles.jsonl
+
+Frames are decoded as fast as possible (no window, no waitKey).
+"""
+
+import os
+import ast
+import json
+import logging
+import argparse
+import functools
+import importlib
+
+import cv2 as cv
+
+from ui.capture import FrameGrabber, GRAB_EVERY
+from processors import filters
+from processors.core import FrameProcessor
+from processors.chain import ProcessorChain
+from processors.pool import ProcessPoolProcessor, POOL_ORDERED
+
+# ------------------------------------------------------------------------------
+
+STAGE_MODULES = [
+    'processors.filters',
+    'processors.backsubtractors',
+    'processors.circles',
+    'processors.counters',
+    'processors.lines',
+    'processors.pedestrian',
+    'processors.trackers',
+]
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+# ------------------------------------------------------------------------------
+
+class ImageDirectory :
+    """
+    Read the images of a directory (sorted by name) like a cv.VideoCapture
+    """
+
+    def __init__(self, path, fps=25.0) :
+        self.path = path
+        self.files = sorted(
+            os.path.join(path, name)
+            for name in os.listdir(path)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        self.fps = fps
+        self._index = 0
+        self._size = (0, 0)
+        if self.files :
+            image = cv.imread(self.files[0])
+            if image is not None :
+                self._size = (image.shape[1], image.shape[0])
+
+    def isOpened(self) :
+        return bool(self.files)
+
+    def read(self, image=None) :
+        if self._index >= len(self.files) :
+            return False, None
+        filename = self.files[self._index]
+        self._index += 1
+        frame = cv.imread(filename)
+        if frame is None :
+            return False, None
+        if image is not None and image.shape == frame.shape :
+            image[...] = frame
+            return True, image
+        return True, frame
+
+    def get(self, prop) :
+        if prop == cv.CAP_PROP_FRAME_WIDTH :
+            return self._size[0]
+        if prop == cv.CAP_PROP_FRAME_HEIGHT :
+            return self._size[1]
+        if prop == cv.CAP_PROP_FPS :
+            return self.fps
+        if prop == cv.CAP_PROP_FRAME_COUNT :
+            return len(self.files)
+        return 0
+
+    def release(self) :
+        self._index = len(self.files)
+
+# ------------------------------------------------------------------------------
+
+def findStage(name) :
+    """
+    Return the Filter or FrameProcessor class called name
+    (Class or module.Class, searched in STAGE_MODULES)
+    """
+    if '.' in name :
+        module_name, class_name = name.rsplit('.', 1)
+        if not module_name.startswith('processors.') :
+            module_name = 'processors.' + module_name
+        return getattr(importlib.import_module(module_name), class_name)
+
+    for module_name in STAGE_MODULES :
+        module = importlib.import_module(module_name)
+        cls = getattr(module, name, None)
+        if isinstance(cls, type) and issubclass(cls, (filters.Filter, FrameProcessor)) :
+            return cls
+
+    raise ValueError('unknown filter or processor', name)
+
+
+def createStage(name, kwargs=None) :
+    """
+    Filters get kwargs in their constructor, processors in params()
+    """
+    kwargs = kwargs or {}
+    cls = findStage(name)
+    if issubclass(cls, FrameProcessor) :
+        stage = cls()
+        if kwargs :
+            stage.params(**kwargs)
+        return stage
+    return cls(**kwargs)
+
+
+def createChain(specs) :
+    """
+    Build a ProcessorChain from a list of (name, kwargs)
+    Module level, so that it can be sent to worker processes.
+    """
+    return ProcessorChain([ createStage(name, kwargs) for name, kwargs in specs ])
+
+# ------------------------------------------------------------------------------
+
+class BatchRunner :
+    """
+    Run a processor (or filter) on every frame of a video file or an image
+    directory, as fast as possible and without display.
+    output : annotated video file
+    results : JSON lines file, one line per frame : timings and the
+              results() of the processors (detections)
+    framesDir : directory for the annotated frames as images
+    The runner is the context given to the processors (frameno, fps).
+    """
+
+    def __init__(self, source, processor, output=None, fourcc='XVID',
+                 results=None, framesDir=None, limit=None) :
+        self.source = source
+        self.processor = processor
+        self.output = output
+        self.fourcc = fourcc
+        self.results = results
+        self.framesDir = framesDir
+        self.limit = limit
+
+        self.frameno = 0
+        self.fps = 0.0
+        self.camera = None
+        self._writer = None
+        self._resultsFile = None
+
+    def open(self) :
+        if os.path.isdir(self.source) :
+            self.camera = ImageDirectory(self.source)
+        else :
+            self.camera = cv.VideoCapture(self.source)
+        if not self.camera.isOpened() :
+            raise IOError("can't open source", self.source)
+        self.fps = self.camera.get(cv.CAP_PROP_FPS) or 25.0
+
+        if self.results :
+            self._resultsFile = open(self.results, 'w')
+        if self.framesDir :
+            os.makedirs(self.framesDir, exist_ok=True)
+
+    def close(self) :
+        if self._writer is not None :
+            self._writer.release()
+            self._writer = None
+        if self._resultsFile is not None :
+            self._resultsFile.close()
+            self._resultsFile = None
+        if self.camera is not None :
+            self.camera.release()
+            self.camera = None
+
+    def frames(self) :
+        """Decode the source in a background thread, yield the frames in order."""
+        grabber = FrameGrabber(self.camera, policy=GRAB_EVERY)
+        grabber.start()
+        try :
+            while self.limit is None or self.frameno < self.limit :
+                index, frame = grabber.acquire()
+                if index is None :
+                    break
+                self.frameno += 1
+                yield frame
+                grabber.release(index)
+        finally :
+            grabber.stop()
+
+    def write(self, frameno, frame, elapsed, results=None) :
+        if frame is None :
+            return
+
+        if self.output :
+            if self._writer is None :
+                self._writer = cv.VideoWriter(
+                    self.output,
+                    cv.VideoWriter_fourcc(*self.fourcc),
+                    self.fps,
+                    (frame.shape[1], frame.shape[0]),
+                    not (frame.ndim < 3)
+                )
+            self._writer.write(frame)
+
+        if self.framesDir :
+            cv.imwrite(
+                os.path.join(self.framesDir, '{:06d}.png'.format(frameno)),
+                frame
+            )
+
+        if self._resultsFile is not None :
+            record = dict(
+                frameno=frameno,
+                width=frame.shape[1],
+                height=frame.shape[0],
+                process_ms=elapsed,
+            )
+            if isinstance(self.processor, ProcessorChain) :
+                record['stages_ms'] = dict(zip(
+                    self.processor.names, self.processor.last
+                ))
+            if results is not None :
+                record['results'] = results
+            self._resultsFile.write(json.dumps(record) + '\n')
+
+    def run(self) :
+        """Process the whole source, return a summary dict."""
+        self.open()
+        freq = 1000.0 / cv.getTickFrequency()
+        pooled = isinstance(self.processor, ProcessPoolProcessor)
+        total = 0.0
+        t0 = cv.getTickCount()
+        try :
+            for frame in self.frames() :
+                t1 = cv.getTickCount()
+                if pooled :
+                    # the frame is copied to shared memory : the grabber
+                    # slot can be reused. Wait for a worker when all are busy
+                    ready = []
+                    while not self.processor.submit(frame, self) :
+                        ready.extend(self.processor.collect(block=True))
+                    ready.extend(self.processor.collect())
+                else :
+                    result = self.processor.apply(frame, self)
+                    ready = [ (self.frameno, result, self.processor.results()) ]
+                elapsed = (cv.getTickCount() - t1) * freq
+                total += elapsed
+                for frameno, result, results in ready :
+                    self.write(frameno, result, elapsed, results)
+
+            if pooled :
+                for frameno, result, results in self.processor.flush() :
+                    self.write(frameno, result, 0.0, results)
+        finally :
+            if pooled :
+                self.processor.close()
+            self.close()
+
+        seconds = (cv.getTickCount() - t0) / cv.getTickFrequency()
+        return dict(
+            frames=self.frameno,
+            seconds=seconds,
+            fps=self.frameno / seconds if seconds > 0 else 0.0,
+            process_ms=total / max(1, self.frameno),
+        )
+
+# ------------------------------------------------------------------------------
+
+def parse_args(argv=None) :
+    """
+    Parse command line arguments
+    """
+    # argument type : key=value, value is a python literal when possible
+    def param(s) :
+        try :
+            key, value = s.split('=', 1)
+        except ValueError :
+            raise argparse.ArgumentTypeError("param must be key=value")
+        try :
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError) :
+            pass
+        return key, value
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'source',
+        help='video file or image directory'
+    )
+    parser.add_argument(
+        'stages',
+        nargs='+',
+        help='filters and/or processors applied in order (ex: StrokeEdgesFilter)'
+    )
+    parser.add_argument(
+        '-p', '--param',
+        type=param,
+        action='append',
+        default=[],
+        help='key=value given to the last stage, may be repeated'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='annotated video file'
+    )
+    parser.add_argument(
+        '--fourcc',
+        default='XVID',
+        help='codec of the annotated video (default: XVID)'
+    )
+    parser.add_argument(
+        '--results',
+        help='JSON lines file with per-frame timings and processor results (detections)'
+    )
+    parser.add_argument(
+        '--frames',
+        help='directory for the annotated frames as images'
+    )
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        default=0,
+        help='worker processes (0: process in this process)'
+    )
+    parser.add_argument(
+        '-n', '--limit',
+        type=int,
+        help='stop after this number of frames'
+    )
+    return parser.parse_args(argv)
+
+# ------------------------------------------------------------------------------
+
+def main(argv=None) :
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    args = parse_args(argv)
+
+    specs = [ (name, {}) for name in args.stages ]
+    specs[-1][1].update(args.param)
+
+    if args.workers > 0 :
+        try :
+            processor = ProcessPoolProcessor(
+                functools.partial(createChain, specs),
+                workers=args.workers,
+                policy=POOL_ORDERED
+            )
+        except ValueError :
+            raise SystemExit('stages keeping state between frames can not run in workers')
+    else :
+        processor = createChain(specs)
+
+    runner = BatchRunner(
+        args.source, processor,
+        output=args.output,
+        fourcc=args.fourcc,
+        results=args.results,
+        framesDir=args.frames,
+        limit=args.limit
+    )
+    summary = runner.run()
+    logging.info(
+        '%(frames)d frames in %(seconds).1fs : %(fps).1f fps, %(process_ms).2f ms/frame',
+        summary
+    )
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__' :
+    main()
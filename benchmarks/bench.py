@@ -0,0 +1,381 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Benchmark of the filters and frame processors on synthetic frames.
+
+python -m benchmarks.bench run [-o results.json] [-r 640x480] [-k Blur]
+python -m benchmarks.bench compare before.json after.json
+
+Runs headless : no camera, no window.
+"""
+
+import sys
+import json
+import time
+import inspect
+import itertools
+import argparse
+import platform
+import datetime
+import importlib
+import tracemalloc
+import types
+
+import cv2 as cv
+import numpy as np
+
+from processors import filters
+from processors.core import FrameProcessor
+
+# ------------------------------------------------------------------------------
+
+RESOLUTIONS = [ (320, 240), (640, 480), (1280, 720), (1920, 1080) ]
+
+PROCESSOR_MODULES = [
+    'processors.backsubtractors',
+    'processors.circles',
+    'processors.counters',
+    'processors.lines',
+    'processors.pedestrian',
+    'processors.trackers',
+]
+
+# constructor arguments for the classes which need some
+FILTER_ARGS = {
+    'VFuncFilter' : dict(vFunc=lambda v : 255 - v),
+    'VCurveFilter' : dict(vPoints=[(0,0),(128,160),(255,255)]),
+    'BGRFuncFilter' : dict(vFunc=lambda v : 255 - v),
+    'BGRCurveFilter' : dict(vPoints=[(0,0),(128,160),(255,255)]),
+    'VConvolutionFilter' : dict(kernel=np.ones((3, 3)) / 9),
+    'ChannelMixerFilter' : dict(matrix=[
+        [0.272, 0.534, 0.131],
+        [0.349, 0.686, 0.168],
+        [0.393, 0.769, 0.189]
+    ]),
+    'LookupTableFilter' : dict(
+        lookupTable=filters.BGRVelviaCurveFilter().lookupTable
+    ),
+    # two curves folded into one table, blur then sharpen into one kernel
+    'FilterChain' : dict(filters=[
+        filters.BGRVelviaCurveFilter(),
+        filters.BGRProviaCurveFilter(),
+        filters.BlurFilter(),
+        filters.SharpenFilter(),
+    ]),
+    # wrappers : around the most expensive filter
+    'ReducedResolutionFilter' : dict(filter=filters.StrokeEdgesFilter()),
+    'RegionFilter' : dict(filter=filters.StrokeEdgesFilter()),
+    'StripeFilter' : dict(filter=filters.StrokeEdgesFilter()),
+    'DirtyTileFilter' : dict(filter=filters.StrokeEdgesFilter()),
+}
+
+# base classes without any processing of their own
+FILTER_EXCLUDE = (
+    'TemporalFilter',
+)
+
+PROCESSOR_ARGS = {
+    'TrackingProcessor' : dict(algo='MIL'),
+}
+
+# interactive processors (selectROI) and wrappers are not benchmarked
+PROCESSOR_EXCLUDE = (
+    'MeanShiftTrackingProcessor',
+    'CamShiftTrackingProcessor',
+)
+
+# ------------------------------------------------------------------------------
+
+def synthetic_frame(width, height, seed=0) :
+    """Deterministic BGR frame : gradient, noise, circles and lines."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:,:,0] = np.add.outer(y, x) / 2
+    frame[:,:,1] = x[np.newaxis,:]
+    frame[:,:,2] = y[:,np.newaxis]
+    noise = rng.integers(0, 32, frame.shape, dtype=np.uint8)
+    cv.add(frame, noise, frame)
+
+    scale = width / 320
+    for n in range(12) :
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(5, 40) * scale)
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv.circle(frame, center, radius, color, -1)
+    for n in range(12) :
+        pt1 = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        pt2 = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv.line(frame, pt1, pt2, (255, 255, 255), max(1, int(scale)))
+
+    return frame
+
+
+def moving_frames(frame, count=8) :
+    """
+    Copies of frame with a patch moving along its diagonal : the
+    incremental (DirtyTileFilter) and temporal filters see a change on
+    each call instead of the same frame again.
+    """
+    height, width = frame.shape[:2]
+    size = max(8, min(width, height) // 8)
+    frames = []
+    for n in range(count) :
+        moved = frame.copy()
+        x = n * (width - size) // (count - 1)
+        y = n * (height - size) // (count - 1)
+        cv.rectangle(moved, (x, y), (x + size - 1, y + size - 1), (0, 0, 255), -1)
+        frames.append(moved)
+    return frames
+
+
+def context(width, height) :
+    """Minimal stand-in for CameraCapture / TrackingZone"""
+    return types.SimpleNamespace(
+        frameno=2, fps=30.0,
+        bbox_ini=(width // 4, height // 4, width // 4, height // 4),
+        bbox=(width // 4, height // 4, width // 4, height // 4),
+        tracked=False, success=None,
+    )
+
+# ------------------------------------------------------------------------------
+
+def list_filters() :
+    return [
+        (name, cls)
+        for name, cls in inspect.getmembers(filters, inspect.isclass)
+        if issubclass(cls, filters.Filter) and cls is not filters.Filter
+        and cls.__module__ == filters.__name__
+        and name not in FILTER_EXCLUDE
+    ]
+
+
+def list_processors() :
+    found = {}
+    for module_name in PROCESSOR_MODULES :
+        module = importlib.import_module(module_name)
+        for name, cls in inspect.getmembers(module, inspect.isclass) :
+            if (issubclass(cls, FrameProcessor)
+                and not inspect.isabstract(cls)
+                and cls.__module__ == module.__name__
+                and name not in PROCESSOR_EXCLUDE) :
+                found[name] = cls
+    return sorted(found.items())
+
+# ------------------------------------------------------------------------------
+
+def measure(call, prepare, seconds, iterations) :
+    """
+    Time call(prepare()) : only call is timed.
+    Returns the list of durations (ms) and the bytes allocated by one call.
+    """
+    # warm up (lazy buffers, tracker init, ...)
+    call(prepare())
+
+    durations = []
+    freq = 1000.0 / cv.getTickFrequency()
+    deadline = time.perf_counter() + seconds
+    while len(durations) < iterations or time.perf_counter() < deadline :
+        args = prepare()
+        t1 = cv.getTickCount()
+        call(args)
+        durations.append((cv.getTickCount() - t1) * freq)
+        if len(durations) >= 10 * iterations :
+            break
+
+    # numpy (and the opencv bindings) report their buffers to tracemalloc
+    args = prepare()
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    call(args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return durations, peak - base
+
+
+def summarize(durations) :
+    durations = np.asarray(durations)
+    p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+    mean = durations.mean()
+    return dict(
+        calls=len(durations),
+        fps=1000.0 / mean if mean > 0 else 0.0,
+        mean_ms=mean,
+        p50_ms=p50,
+        p95_ms=p95,
+        p99_ms=p99,
+    )
+
+
+def bench_filter(cls, frame, seconds, iterations) :
+    instance = cls(**FILTER_ARGS.get(cls.__name__, {}))
+    dst = np.empty_like(frame)
+    # a different frame on each call : no filter can reuse its last result
+    frames = itertools.cycle(moving_frames(frame))
+    return measure(
+        lambda args : instance.apply(args, dst),
+        lambda : next(frames),
+        seconds, iterations
+    )
+
+
+def bench_processor(cls, frame, seconds, iterations) :
+    instance = cls(**PROCESSOR_ARGS.get(cls.__name__, {}))
+    ctx = context(frame.shape[1], frame.shape[0])
+    # processors draw on their frame : give them a fresh copy (untimed)
+    return measure(
+        lambda args : instance.apply(args, ctx),
+        lambda : frame.copy(),
+        seconds, iterations
+    )
+
+
+def run(resolutions=RESOLUTIONS, keyword=None, seconds=1.0, iterations=20,
+        out=sys.stdout) :
+    """Run the benchmarks, return the results as a dict."""
+
+    candidates = (
+        [ ('filter', name, cls, bench_filter) for name, cls in list_filters() ]
+        + [ ('processor', name, cls, bench_processor) for name, cls in list_processors() ]
+    )
+    if keyword :
+        candidates = [ c for c in candidates if keyword.lower() in c[1].lower() ]
+
+    results = []
+    for width, height in resolutions :
+        frame = synthetic_frame(width, height)
+        resolution = '{}x{}'.format(width, height)
+        for kind, name, cls, bench in candidates :
+            entry = dict(kind=kind, name=name, resolution=resolution)
+            try :
+                durations, allocated = bench(cls, frame, seconds, iterations)
+                entry.update(summarize(durations))
+                entry['bytes_per_call'] = int(allocated)
+            except Exception as e :
+                message = (str(e).strip().splitlines() or [''])[0]
+                entry['error'] = '{}: {}'.format(e.__class__.__name__, message)
+            results.append(entry)
+            print(format_entry(entry), file=out)
+            out.flush()
+
+    return dict(
+        meta=dict(
+            date=datetime.datetime.now().isoformat(timespec='seconds'),
+            platform=platform.platform(),
+            python=platform.python_version(),
+            opencv=cv.__version__,
+            numpy=np.__version__,
+            threads=cv.getNumThreads(),
+        ),
+        results=results,
+    )
+
+
+def format_entry(entry) :
+    head = '{:9s} {:32s} {:>9s}'.format(entry['kind'], entry['name'], entry['resolution'])
+    if 'error' in entry :
+        return '{}  error : {}'.format(head, entry['error'])
+    return '{} {:8.1f} fps  p50 {:8.2f}  p95 {:8.2f}  p99 {:8.2f} ms  {:10d} B/call'.format(
+        head, entry['fps'],
+        entry['p50_ms'], entry['p95_ms'], entry['p99_ms'],
+        entry['bytes_per_call']
+    )
+
+# ------------------------------------------------------------------------------
+
+def compare(before, after, out=sys.stdout) :
+    """Print the p50 latency ratio (after / before) of two runs."""
+
+    def index(run) :
+        return dict(
+            ((e['kind'], e['name'], e['resolution']), e)
+            for e in run['results'] if 'error' not in e
+        )
+
+    old, new = index(before), index(after)
+    for key in sorted(set(old) & set(new)) :
+        o, n = old[key], new[key]
+        ratio = n['p50_ms'] / o['p50_ms'] if o['p50_ms'] > 0 else float('inf')
+        print('{:9s} {:32s} {:>9s}  p50 {:8.2f} -> {:8.2f} ms  x{:5.2f}  {:10d} -> {:10d} B/call'.format(
+            key[0], key[1], key[2],
+            o['p50_ms'], n['p50_ms'], ratio,
+            o['bytes_per_call'], n['bytes_per_call']
+        ), file=out)
+
+# ------------------------------------------------------------------------------
+
+def parse_args(argv=None) :
+
+    # argument type : resolution
+    def resolution(s) :
+        try :
+            w, h = map(int, s.split('x'))
+            return w, h
+        except :
+            raise argparse.ArgumentTypeError("resolution must WxH integers")
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument(
+        '-r', '--resolution',
+        type=resolution,
+        action='append',
+        help='WxH frame size, may be repeated (default: 320x240 to 1920x1080)'
+    )
+    run_parser.add_argument(
+        '-k', '--keyword',
+        help='only the classes whose name contains this keyword'
+    )
+    run_parser.add_argument(
+        '-s', '--seconds',
+        type=float,
+        default=1.0,
+        help='minimum time spent on each class and resolution'
+    )
+    run_parser.add_argument(
+        '-n', '--iterations',
+        type=int,
+        default=20,
+        help='minimum number of calls for each class and resolution'
+    )
+    run_parser.add_argument(
+        '-o', '--output',
+        help='JSON file for the results'
+    )
+
+    compare_parser = commands.add_parser('compare', help='compare two JSON results')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None) :
+    args = parse_args(argv)
+
+    if args.command == 'compare' :
+        with open(args.before) as f :
+            before = json.load(f)
+        with open(args.after) as f :
+            after = json.load(f)
+        compare(before, after)
+        return
+
+    results = run(
+        resolutions=args.resolution or RESOLUTIONS,
+        keyword=args.keyword,
+        seconds=args.seconds,
+        iterations=args.iterations,
+    )
+    if args.output :
+        with open(args.output, 'w') as f :
+            json.dump(results, f, indent=2)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__' :
+    main()
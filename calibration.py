@@ -99,7 +99,7 @@ class Camera :
         keypress manager
         """
         if keycode == 27 or keycode == ord('q'):
-            self.capture.camera.release()
+            self.capture.release()
         elif keycode == ord('i') :
             self.capture.openSettings()
         elif keycode == ord('h') :
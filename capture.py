@@ -6,7 +6,9 @@ import numpy
 
 from ui.capture import CaptureManager
 from ui.window import WindowManager
+from ui.histogram import HistogramView, HIST_GRAY, HIST_BGR, HIST_HS
 from processors import filters
+from processors.registry import FilterRegistry, DEFAULT_CACHE_DIR
 
 class Cameo :
 
@@ -24,7 +26,25 @@ class Cameo :
         self.capture.width = 800
         self.capture.height = 448
         self._filter = None
+        # filters created once, switched by key
+        self.filters = FilterRegistry()
+        self.filters.define(ord('b'), filters.BlurFilter)
+        self.filters.define(ord('g'), filters.FindEdgesFilter)
+        self.filters.define(ord('!'), filters.StrokeEdgesFilter)
+        self.filters.define(ord('e'), filters.EmbossFilter)
+        self.filters.define(ord('s'), filters.SharpenFilter)
+        self.filters.define(ord('G'), filters.GaussianBlurFilter, kernel=(21,21))
+        self.filters.define(
+            ord('c'), filters.CannyEdgesFilter, threshold=30, overlay=False
+        )
+        self.filters.prewarm(background=True)
         self._display = True
+        self._timings = False
+        # histogram overlays, cycled by key
+        self._histograms = [ None ] + [
+            HistogramView(mode) for mode in (HIST_GRAY, HIST_BGR, HIST_HS)
+        ]
+        self._histogram = 0
 
     def run(self) :
         """Run the main loop."""
@@ -35,7 +55,21 @@ class Cameo :
 
             # filters
             if self._filter is not None :
-                self._filter.apply(frame, frame)
+                with self.capture.timings.stage('process') :
+                    self._filter.apply(frame, frame)
+
+            self.capture.timings.start('overlay')
+
+            # show stage timings ?
+            if self._timings :
+                self.capture.timings.draw(frame)
+
+            # show histogram ?
+            histogram = self._histograms[self._histogram]
+            if histogram is not None :
+                histogram.draw(
+                    frame, (frame.shape[1] - histogram.size[0] - 10, 10)
+                )
 
             # show infos ?
             if self._display :
@@ -54,6 +88,7 @@ class Cameo :
                         cv.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 255), 1
                     )
 
+            self.capture.timings.stop('overlay')
             self.capture.exitFrame()
             self.win.processEvents()
     
@@ -68,34 +103,30 @@ class Cameo :
             self.capture.writeImage('screenshot.png')
         elif keycode == 9 : # tab
             if not self.capture.isWritingVideo :
-                self.capture.startWritingVideo('screencast.avi', 'XVID')
+                self.capture.startWritingVideo(
+                    'screencast.avi', 'XVID',
+                    asynchronous=True
+                )
             else :
                 self.capture.stopWritingVideo()
         elif keycode == 27 or keycode == ord('q') : # 27 = escape
-            self.capture.camera.release()
+            self.capture.release()
             self.win.destroyWindow()
-        elif keycode == ord('b') :
-            self._filter = filters.BlurFilter()
-        elif keycode == ord('g') :
-            self._filter = filters.FindEdgesFilter()
-        elif keycode == ord('!') :
-            self._filter = filters.StrokeEdgesFilter()
-        elif keycode == ord('e') :
-            self._filter = filters.EmbossFilter()
-        elif keycode == ord('s') :
-            self._filter = filters.SharpenFilter()
-        elif keycode == ord('G') :
-            self._filter = filters.GaussianBlurFilter(kernel=(21,21))
-        elif keycode == ord('c') :
-            self._filter = filters.CannyEdgesFilter(threshold=30, overlay=False)
+        elif keycode in self.filters :
+            self._filter = self.filters[keycode]
         elif keycode == ord('i') :
             self._display = not self._display
+        elif keycode == ord('t') :
+            self._timings = not self._timings
+        elif keycode == ord('h') :
+            self._histogram = (self._histogram + 1) % len(self._histograms)
         elif keycode == ord('p') :
             self.capture.openSettings()
         elif keycode == ord('x') :
             self._filter = None
 
 if __name__ == '__main__' :
+    filters.setTableCacheDirectory(DEFAULT_CACHE_DIR)
     source = ''.join(sys.argv[1:]) or '0'
     print(source)
     source = int(source) if source.isdigit() else source
@@ -156,7 +156,8 @@ class PongGame(arcade.Window):
             nZones=self.options.nZones,
             yZone=self.options.yZone,
             wZone=self.options.wZone,
-            hZone=self.options.hZone
+            hZone=self.options.hZone,
+            workers=self.options.workers
         )
         self.detector.start()
         
@@ -454,6 +455,12 @@ def parse_args() :
         default=400,
         help='height of each tracking zone'
     )
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        default=0,
+        help='threads updating the zones concurrently (0: sequential)'
+    )
     parser.add_argument(
         '--screen',
         type=screen,
@@ -12,6 +12,7 @@ import functools
 from ui.capture import CaptureManager
 from ui.settings import CameraSettings
 from processors import filters
+from processors.registry import FilterRegistry, DEFAULT_CACHE_DIR
 
 class Application :
 
@@ -25,6 +26,14 @@ class Application :
         self.capcfg = CameraSettings(self.vidcap)
         
         self.filter = None
+        # filters created once, switched by the buttons
+        self.filters = FilterRegistry()
+        self.filters.define('Velvia', filters.BGRVelviaCurveFilter)
+        self.filters.define('XProcess', filters.BGRCrossProcessCurveFilter)
+        self.filters.define('Stroke Edges', filters.StrokeEdgesFilter)
+        self.filters.define('Canny Edges', filters.CannyEdgesFilter, threshold=30)
+        self.filters.define('Threshold', filters.ThresholdFilter)
+        self.filters.prewarm(background=True)
 
         body = tk.Frame(root)
         self.initial_focus = self.body(body)
@@ -76,7 +85,7 @@ class Application :
 
     def cancel(self) :
         self.root.destroy()
-        self.vidcap.release()
+        self.capman.release()
 
     def take_snapshot(self) :
         """ Take snapshot and save to file """
@@ -90,16 +99,8 @@ class Application :
             self.capcfg.openSettings()
         elif action == 'Dump' :
             print(self.capcfg.settings)
-        elif action == 'Velvia' :
-            self.filter = filters.BGRVelviaCurveFilter()
-        elif action == 'XProcess' :
-            self.filter = filters.BGRCrossProcessCurveFilter()
-        elif action == 'Stroke Edges' :
-            self.filter = filters.StrokeEdgesFilter()
-        elif action == 'Canny Edges' :
-            self.filter = filters.CannyEdgesFilter(threshold=30)
-        elif action == 'Threshold' :
-            self.filter = filters.ThresholdFilter()
+        elif action in self.filters :
+            self.filter = self.filters[action]
 
     def refresh_stats(self) :
         self.fps.config(text='{:.2f}'.format(self.capman.fpsEstimate))
@@ -128,5 +129,6 @@ class Application :
         self.root.after(20, self.video_loop)
 
 if __name__ == '__main__' :
+    filters.setTableCacheDirectory(DEFAULT_CACHE_DIR)
     app = Application()
     app.root.mainloop()
@@ -3,9 +3,12 @@
 import sys
 import logging
 import threading
+import concurrent.futures
 import cv2 as cv
 
 from processors.trackers import TrackingZone
+from processors.filters import RegionFilter
+from ui.timing import StageTimer
 
 __all_ = [ 'Detector' ]
 
@@ -21,10 +24,14 @@ class Detector(threading.Thread) :
     yZone : top y coordinate for each zone
     wZone, hZone : width and height for each zone
     xZone is computed by spacing zones equaly in the x direction.
+    workers : number of threads updating the zones concurrently
+              (0 : zones are updated one after another)
+    preprocess : optional filter applied on the zones only, before tracking
     """
 
     def __init__(self, source, width=640, height=480, algo='MOSSE',
-                 nZones=3, yZone=100, wZone=100, hZone=320) :
+                 nZones=3, yZone=100, wZone=100, hZone=320, workers=0,
+                 preprocess=None) :
 
         # init threading.Thread
         super().__init__(name='DetectorThread', daemon=True)
@@ -44,6 +51,10 @@ class Detector(threading.Thread) :
         self.fps = 0
         self.frameno = 0
 
+        # rolling latency of each stage of the mainloop
+        self.timings = StageTimer()
+        self.showTimings = False
+
         # algo
         self._restart = False
         self._algo = algo
@@ -56,6 +67,14 @@ class Detector(threading.Thread) :
         self.yZone, self.wZone, self.hZone = yZone, wZone, hZone
         self.zones = []
 
+        # parallel tracking
+        self.workers = workers
+        self._pool = None
+
+        # preprocessing restricted to the zones
+        self.preprocess = preprocess
+        self._preprocess = None
+
     def init_zones(self) :
         """
         Prepare initial zones for detection
@@ -75,6 +94,12 @@ class Detector(threading.Thread) :
             )
             logging.debug('init_zones : TrackingZone #%s', zone)
 
+    def zone_rects(self) :
+        """
+        Initial rects (x, y, w, h) of the zones
+        """
+        return [ zone.bbox_ini for zone in self.zones ]
+
     def reinit_tracking(self) :
         """
         reinit tracking for each zone
@@ -154,6 +179,27 @@ class Detector(threading.Thread) :
             
         return int(dy)
 
+    def update_zones(self, frame) :
+        """
+        Update the tracking of every zone on the same frame, then draw
+        the results. With workers, the trackers run concurrently and the
+        drawing is done afterwards, in zone order, on this thread.
+        """
+        self.timings.start('process')
+        if self._pool is None :
+            for zone in self.zones :
+                zone.track(frame)
+        else :
+            # wait for every zone before touching the frame
+            list(self._pool.map(lambda zone : zone.track(frame), self.zones))
+        self.timings.stop('process')
+
+        with self.timings.stage('draw') :
+            for zone in self.zones :
+                frame = zone.draw(frame)
+
+        return frame
+
     def run(self) :
         """
         Run the mainloop for camera capture and processing
@@ -161,6 +207,13 @@ class Detector(threading.Thread) :
 
         # prepare zones
         self.init_zones()
+
+        # prepare the tracking threads
+        if self.workers > 0 :
+            self._pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix='TrackingZone'
+            )
         
         # prepare the preview
         cv.namedWindow(self.name)
@@ -173,8 +226,12 @@ class Detector(threading.Thread) :
                 self.reinit_tracking()
 
             # grab a new frame
-            ok, frame = self.cam.read()
+            with self.timings.stage('grab') :
+                ok, frame = self.cam.read()
             self.frameno += 1
+            if self.cam.get(cv.CAP_PROP_FRAME_COUNT) <= 0 :
+                # live camera : count the frames missed by a slow loop
+                self.timings.frame(self.cam.get(cv.CAP_PROP_FPS))
 
             # check frame validity
             if frame is None :
@@ -189,21 +246,40 @@ class Detector(threading.Thread) :
             # horizontal mirror
             frame[:,::-1,:] = frame
 
+            # preprocess the zones only
+            if self.preprocess is not None :
+                if self._preprocess is None :
+                    self._preprocess = RegionFilter(
+                        self.preprocess,
+                        self.zone_rects()
+                    )
+                with self.timings.stage('preprocess') :
+                    self._preprocess.apply(frame, frame)
+
             # process the frame
-            for zone in self.zones :
-                frame = zone.update(frame)
+            frame = self.update_zones(frame)
 
             # add onscreen feedback
-            self.display_infos(frame)
+            with self.timings.stage('infos') :
+                self.display_infos(frame)
+                if self.showTimings :
+                    self.timings.draw(frame, (15, 30 + 16 * len(self.zones)))
 
             # display the frame
-            cv.imshow(self.name, frame)
+            with self.timings.stage('display') :
+                cv.imshow(self.name, frame)
 
             # update fps
             self.fps = cv.getTickFrequency() / (cv.getTickCount() - t1)
 
             # process events
-            self.processEvents()
+            with self.timings.stage('events') :
+                self.processEvents()
+
+        # stop the tracking threads
+        if self._pool is not None :
+            self._pool.shutdown()
+            self._pool = None
 
         # close the preview
         cv.destroyWindow(self.name)
@@ -287,3 +363,6 @@ class Detector(threading.Thread) :
         elif keycode == ord('i') :
             logging.debug('key i : camera settings')
             self.cam.set(cv.CAP_PROP_SETTINGS, True)
+        elif keycode == ord('t') :
+            logging.debug('key t : show stage timings')
+            self.showTimings = not self.showTimings
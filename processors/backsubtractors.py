@@ -18,6 +18,8 @@ OPENCV_BACKSUB_ALGOS = {
 
 class BackSubProcessor(FrameProcessor) :
 
+    stateful = True
+
     def params(self, **kwargs) :
         algo = kwargs.get('algo', 'MOG2')
         try :
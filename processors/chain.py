@@ -0,0 +1,103 @@
+# -*- encoding: utf8 -*-
+
+import cv2 as cv
+
+from .core import FrameProcessor
+
+__all__ = [ 'ProcessorChain' ]
+
+# ------------------------------------------------------------------------------
+
+class ProcessorChain(FrameProcessor) :
+    """
+    Run an ordered list of stages on the same frame and context.
+    A stage is either a FrameProcessor (apply(frame, context) -> frame)
+    or a filters.Filter (apply(src, dst)), the latter runs in place.
+    The wall time of each stage is recorded in milliseconds.
+    """
+
+    def __init__(self, stages=None) :
+        self.stages = list(stages or [])
+        super().__init__()
+
+    def params(self, **kwargs) :
+        self.timing = kwargs.get('timing', True)
+        self.reset_timings()
+
+    def add(self, stage) :
+        self.stages.append(stage)
+        self.reset_timings()
+        return self
+
+    def __len__(self) :
+        return len(self.stages)
+
+    def __iter__(self) :
+        return iter(self.stages)
+
+    @property
+    def stateful(self) :
+        return any(getattr(stage, 'stateful', False) for stage in self.stages)
+
+    @property
+    def names(self) :
+        return [
+            '{}:{}'.format(n, stage.__class__.__name__)
+            for n, stage in enumerate(self.stages)
+        ]
+
+    def reset_timings(self) :
+        """Forget the recorded stage times."""
+        self.frames = 0
+        self.last = [0.0] * len(self.stages)
+        self.totals = [0.0] * len(self.stages)
+
+    @property
+    def timings(self) :
+        """
+        Per stage timings : { name : (last ms, mean ms) }
+        """
+        frames = max(1, self.frames)
+        return dict(
+            (name, (last, total / frames))
+            for name, last, total in zip(self.names, self.last, self.totals)
+        )
+
+    def apply(self, frame, context) :
+        if len(self.last) != len(self.stages) :
+            self.reset_timings()
+
+        freq = 1000.0 / cv.getTickFrequency()
+        for n, stage in enumerate(self.stages) :
+            t1 = cv.getTickCount()
+
+            if isinstance(stage, FrameProcessor) :
+                result = stage.apply(frame, context)
+                if result is not None :
+                    frame = result
+            else :
+                # filters write their result into the same buffer
+                stage.apply(frame, frame)
+
+            if self.timing :
+                elapsed = (cv.getTickCount() - t1) * freq
+                self.last[n] = elapsed
+                self.totals[n] += elapsed
+
+        self.frames += 1
+        return frame
+
+    def results(self) :
+        """
+        Results of the last apply() of the stages which have some :
+        { name : results }, None when there are none
+        """
+        results = {}
+        for name, stage in zip(self.names, self.stages) :
+            if isinstance(stage, FrameProcessor) :
+                result = stage.results()
+                if result is not None :
+                    results[name] = result
+        return results or None
+
+# ------------------------------------------------------------------------------
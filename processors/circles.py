@@ -13,6 +13,8 @@ __all__ = [ 'CirclesProcessor' ]
 
 class CirclesProcessor(FrameProcessor) :
 
+    _results = None
+
     def params(self, **kwargs) :
         self.param1 = kwargs.get('param1', 50)
         self.param2 = kwargs.get('param2', 30)
@@ -40,7 +42,15 @@ class CirclesProcessor(FrameProcessor) :
                 #print('-> ', circle)
                 drawCircle(frame, circle)
 
+        # (x, y, radius) in the returned (resized) frame
+        self._results = dict(circles=[
+            [ float(v) for v in circle ]
+            for circle in (circles[0] if circles is not None else [])
+        ])
         return frame
+
+    def results(self) :
+        return self._results
         
 # ------------------------------------------------------------------------------
 
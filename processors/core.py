@@ -10,6 +10,9 @@ __all__ = [ 'FrameProcessor' ]
 
 class FrameProcessor(abc.ABC) :
 
+    # True when the result depends on the previous frames
+    stateful = False
+
     def __init__(self) :
         self.params()
 
@@ -21,4 +24,11 @@ class FrameProcessor(abc.ABC) :
     def apply(self, frame, context) :
         pass
 
+    def results(self) :
+        """
+        Results of the last apply() (detections, ...) as a JSON
+        serializable dict, None for the processors which only draw
+        """
+        return None
+
 # ------------------------------------------------------------------------------
@@ -1,11 +1,25 @@
 # -*- encoding: utf-8 -*-
 
+import copy
+import math
+import fractions
+import concurrent.futures
+import multiprocessing
+
 import cv2 as cv
 import numpy as np
 from . import utils
 
 class Filter :
 
+    # rows of neighbourhood needed around a pixel (see StripeFilter)
+    halo = 0
+    # True when the result depends on the position of the image in the
+    # frame (rects) : such filters can't run on stripes or tiles
+    positional = False
+    # True when the result depends on the previous frames
+    stateful = False
+
     def __init__(self) :
         """Method to override to add parameters to the filter.
         """
@@ -15,247 +29,471 @@ class Filter :
         """Method to override to apply the filter.
 
         Pseudocode :
-        b, g, r = cv.split(src)
-        filter b, g, r composants
-        cv.merge((b, g, r), dst)
+        tmp = self.buffers.like('tmp', src)
+        cv.function(src, ..., tmp)
+        cv.function(tmp, ..., dst)
+        src and dst may be the same image (see FilterChain).
         """
         pass
 
+    @property
+    def columnHalo(self) :
+        """Columns of neighbourhood needed around a pixel (see
+        DirtyTileFilter) : as many as the rows, unless the filter says
+        otherwise (wide kernels).
+        """
+        return self.halo
 
-class RecolorRC(Filter) :
-
-    def apply(self, src, dst) :
-        """Simulate conversion from BGR to RC (red, cyan).
+    @property
+    def align(self) :
+        """Rows multiple of which a stripe or tile must start to give the
+        same result as the whole image : the reduced resolution filters
+        sample the image on a grid of 1 / scale pixels.
+        """
+        scale = getattr(self, 'scale', 1.0)
+        if scale >= 1 :
+            return 1
+        return fractions.Fraction(scale).limit_denominator(64).denominator
 
-        The source and destination images must both be in BGR format.
-        Blues and greens are replaced with cyans.
+    def clone(self) :
+        """Return a copy of the filter sharing its parameters and tables,
+        with its own scratch buffers.
 
-        Pseudocode:
-        dst.b = dst.g = 0.5 * (src.b + src.g)
-        dst.r = src.r
+        The filters holding other filters clone them too.
+        """
+        clone = copy.copy(self)
+        clone._buffers = utils.BufferPool()
+        return clone
+
+    @property
+    def buffers(self) :
+        """Scratch buffers kept by the filter between frames."""
+        try :
+            return self._buffers
+        except AttributeError :
+            self._buffers = utils.BufferPool()
+            return self._buffers
+
+    def blend(self, src, alpha, dst) :
+        """dst = src * alpha / 255, alpha being a one channel uint8 mask.
+
+        The mask is broadcast over the channels into a preallocated
+        buffer, then one saturating multiply-and-scale does the blending.
         """
-        b, g, r = cv.split(src)
-        cv.addWeighted(b, 0.5, g, 0.5, 0, b)
-        cv.merge((b, b, r), dst)
+        if not utils.isGray(src) :
+            alpha = cv.cvtColor(
+                alpha, cv.COLOR_GRAY2BGR,
+                self.buffers.like('alpha', src)
+            )
+        cv.multiply(src, alpha, dst, scale=1.0 / 255)
+
+    def downscale(self, src, scale, name = 'small') :
+        """Return src resized by scale into a preallocated buffer."""
+        h, w = src.shape[:2]
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        small = self.buffers.get(name, (size[1], size[0]) + src.shape[2:], src.dtype)
+        cv.resize(src, size, small, interpolation=cv.INTER_AREA)
+        return small
+
+    def upscale(self, small, like, dst = None, name = 'large') :
+        """Return small resized to the size of like (into dst if given)."""
+        h, w = like.shape[:2]
+        if dst is None :
+            dst = self.buffers.get(name, (h, w) + small.shape[2:], small.dtype)
+        cv.resize(small, (w, h), dst, interpolation=cv.INTER_LINEAR)
+        return dst
+
+    def gray(self, src) :
+        """Return src converted to gray into a preallocated plane."""
+        if utils.isGray(src) :
+            return src
+        gray = self.buffers.get('gray', src.shape[:2], src.dtype)
+        cv.cvtColor(src, cv.COLOR_BGR2GRAY, gray)
+        return gray
+
 
+class ChannelMixerFilter(Filter) :
+    """A filter that mixes the channels with a matrix, in one pass.
 
-class RecolorRGV(Filter) :
+    dst[c] = sum(matrix[c][k] * src[k]) + offset[c]
+    matrix is 3x3 (or 3x4, the last column being the offset).
+    """
+
+    def __init__(self, matrix, offset = None) :
+        matrix = np.asarray(matrix, dtype = np.float32)
+        if offset is not None :
+            matrix = np.column_stack((
+                matrix,
+                np.asarray(offset, dtype = np.float32)
+            ))
+        self._matrix = matrix
+
+    @property
+    def matrix(self) :
+        return self._matrix
 
     def apply(self, src, dst) :
-        """Simulate conversion from BGR to RGV (red, green, value).
+        """Apply the filter with a BGR source/destination."""
+        cv.transform(src, self._matrix, dst)
 
-        The source and destination images must both be in BGR format.
-        Blues are desaturated.
 
-        Pseudocode:
-        dst.b = min(src.b, src.g, src.r)
-        dst.g = src.g
-        dst.r = src.r
-        """
-        b, g, r = cv.split(src)
-        cv.min(b, g, b)
-        cv.min(b, r, b)
-        cv.merge((b, g, r), dst)
+class ChannelReductionFilter(Filter) :
+    """A filter that replaces one channel by the min (or max) of all.
+
+    The reduction works on the interleaved pixels : the image is seen as
+    one channel rows of b, g, r values, eroded (min) or dilated (max) over
+    3 values. The result of each pixel is on its middle (g) value, it is
+    copied in the target channel, the other channels are left unchanged.
+    """
 
-class RecolorCMV(Filter) :
+    def __init__(self, reduction = 'min', channel = 0) :
+        if reduction not in ('min', 'max') :
+            raise ValueError('unknown reduction', reduction)
+        self._reduce = cv.erode if reduction == 'min' else cv.dilate
+        self._channel = channel
+        self._kernel = np.ones((1, 3), dtype = np.uint8)
 
     def apply(self, src, dst) :
-        """Simulate conversion from BGR to CMV (cyan, magenta, value).
+        """Apply the filter with a BGR source/destination."""
 
-        The source and destination images must both be in BGR format.
-        Yellows are desaturated.
+        assert src.shape[2] == 3
+        rows = src.shape[0]
+        reduced = self.buffers.like('reduced', src)
+        self._reduce(
+            src.reshape(rows, -1),
+            self._kernel,
+            reduced.reshape(rows, -1),
+            borderType = cv.BORDER_REPLICATE
+        )
 
-        Pseudocode:
-        dst.b = max(src.b, src.g, src.r)
-        dst.g = src.g
-        dst.r = src.r
-        """
-        b, g, r = cv.split(src)
-        cv.max(b, g, b)
-        cv.max(b, r, b)
-        cv.merge((b, g, r), dst)
+        if dst is not src :
+            np.copyto(dst, src)
+        cv.mixChannels([reduced], [dst], [1, self._channel])
 
 
-class VFuncFilter(Filter) :
-    """A filter that applies a function to V (or all of BGR)."""
-    
-    def __init__(self, vFunc = None, dtype = np.uint8) :
-        length = np.iinfo(dtype).max + 1
-        self._vLookupArray = utils.createLookupArray(vFunc, length)
+class RecolorRC(ChannelMixerFilter) :
+    """Simulate conversion from BGR to RC (red, cyan).
+
+    The source and destination images must both be in BGR format.
+    Blues and greens are replaced with cyans.
+
+    Pseudocode:
+    dst.b = dst.g = 0.5 * (src.b + src.g)
+    dst.r = src.r
+    """
+
+    def __init__(self) :
+        super().__init__([
+            [0.5, 0.5, 0.0],
+            [0.5, 0.5, 0.0],
+            [0.0, 0.0, 1.0]
+        ])
+
+
+class RecolorRGV(ChannelReductionFilter) :
+    """Simulate conversion from BGR to RGV (red, green, value).
+
+    The source and destination images must both be in BGR format.
+    Blues are desaturated.
+
+    Pseudocode:
+    dst.b = min(src.b, src.g, src.r)
+    dst.g = src.g
+    dst.r = src.r
+    """
+
+    def __init__(self) :
+        super().__init__('min', 0)
+
+
+class RecolorCMV(ChannelReductionFilter) :
+    """Simulate conversion from BGR to CMV (cyan, magenta, value).
+
+    The source and destination images must both be in BGR format.
+    Yellows are desaturated.
+
+    Pseudocode:
+    dst.b = max(src.b, src.g, src.r)
+    dst.g = src.g
+    dst.r = src.r
+    """
+
+    def __init__(self) :
+        super().__init__('max', 0)
+
+
+def _pointsKey(points) :
+    """Hashable form of curve control points"""
+    if points is None :
+        return None
+    return tuple((float(x), float(y)) for x, y in points)
+
+
+class LookupTableFilter(Filter) :
+    """A filter that maps each pixel value through a lookup table.
+
+    The table is (length, 1, channels), see utils.createLookupTable.
+    None leaves the source unchanged.
+    The curve filters share their tables through tableCache
+    (see setTableCacheDirectory to keep them across runs).
+    """
+
+    tableCache = utils.LookupTableCache()
+
+    def __init__(self, lookupTable = None) :
+        self.lookupTable = lookupTable
 
     def apply(self, src, dst):
         """Apply the filter with a BGR or gray source/destination."""
 
-        srcFlatView = utils.flatView(src)
-        dstFlatView = utils.flatView(dst)
-        utils.applyLookupArray(
-            self._vLookupArray,
-            srcFlatView,
-            dstFlatView
-        )
+        utils.applyLookupTable(self.lookupTable, src, dst, self.buffers)
 
 
-class VCurveFilter(VFuncFilter):
-    """A filter that applies a curve to V (or all of BGR)."""
+def setTableCacheDirectory(directory) :
+    """Save the lookup tables of the curve filters in directory, so that
+    they are built once across runs (None : kept in memory only)."""
+    LookupTableFilter.tableCache.directory = directory
 
-    def __init__(self, vPoints, dtype = np.uint8) :
-        super().__init__(
-            utils.createCurveFunc(vPoints),
-            dtype
+
+class VFuncFilter(LookupTableFilter) :
+    """A filter that applies a function to V (or all of BGR).
+
+    bits : significant bits of the samples, for 10 to 14-bit data in
+           np.uint16 (default: all the bits of dtype)
+    """
+    
+    def __init__(self, vFunc = None, dtype = np.uint8, bits = None) :
+        length = utils.lookupLength(dtype, bits)
+        lookupTable = None
+        if vFunc is not None :
+            lookupTable = utils.createLookupTable([vFunc], length, dtype)
+        super().__init__(lookupTable)
+
+
+class VCurveFilter(VFuncFilter):
+    """A filter that applies a curve to V (or all of BGR).
+
+    pointsRange : range of the control points, when it is not the range
+                  of the samples (ex: 256 for 8-bit points on 16-bit data)
+    """
+
+    def __init__(self, vPoints, dtype = np.uint8, bits = None,
+                 pointsRange = None) :
+        length = utils.lookupLength(dtype, bits)
+        if pointsRange is not None :
+            vPoints = utils.scaleCurvePoints(vPoints, length, pointsRange)
+        lookupTable = self.tableCache.get(
+            ('V', length, np.dtype(dtype).str, _pointsKey(vPoints)),
+            lambda : VFuncFilter(
+                utils.createCurveFunc(vPoints), dtype, bits
+            ).lookupTable
         )
+        LookupTableFilter.__init__(self, lookupTable)
 
 
-class BGRFuncFilter(Filter) :
+class BGRFuncFilter(LookupTableFilter) :
     """A filter that applies different functions to each of BGR."""
 
     def __init__(self, vFunc = None, bFunc = None, gFunc = None,
-                 rFunc = None, dtype = np.uint8) :
+                 rFunc = None, dtype = np.uint8, bits = None) :
         
-        length = np.iinfo(dtype).max + 1
-        self._bLookupArray = utils.createLookupArray(
-            utils.createCompositeFunc(bFunc, vFunc),
-            length
-        )
-        self._gLookupArray = utils.createLookupArray(
-            utils.createCompositeFunc(gFunc, vFunc),
-            length
-        )
-        self._rLookupArray = utils.createLookupArray(
-            utils.createCompositeFunc(rFunc, vFunc),
-            length
-        )
-
-    def apply(self, src, dst):
-        """Apply the filter with a BGR source/destination."""
-        
-        b, g, r = cv.split(src)
-        utils.applyLookupArray(self._bLookupArray, b, b)
-        utils.applyLookupArray(self._gLookupArray, g, g)
-        utils.applyLookupArray(self._rLookupArray, r, r)
-        cv.merge([b, g, r], dst)
+        length = utils.lookupLength(dtype, bits)
+        super().__init__(utils.createLookupTable(
+            [
+                utils.createCompositeFunc(bFunc, vFunc),
+                utils.createCompositeFunc(gFunc, vFunc),
+                utils.createCompositeFunc(rFunc, vFunc),
+            ],
+            length,
+            dtype
+        ))
 
 
 class BGRCurveFilter(BGRFuncFilter):
-    """A filter that applies different curves to each of BGR."""
+    """A filter that applies different curves to each of BGR.
+
+    pointsRange : range of the control points, when it is not the range
+                  of the samples (ex: 256 for 8-bit points on 16-bit data)
+    """
 
     def __init__(self, vPoints = None, bPoints = None,
-                 gPoints = None, rPoints = None, dtype = np.uint8):
-        super().__init__(
-            utils.createCurveFunc(vPoints),
-            utils.createCurveFunc(bPoints),
-            utils.createCurveFunc(gPoints),
-            utils.createCurveFunc(rPoints),
-            dtype
+                 gPoints = None, rPoints = None, dtype = np.uint8,
+                 bits = None, pointsRange = None):
+        length = utils.lookupLength(dtype, bits)
+        if pointsRange is not None :
+            vPoints, bPoints, gPoints, rPoints = (
+                utils.scaleCurvePoints(points, length, pointsRange)
+                for points in (vPoints, bPoints, gPoints, rPoints)
+            )
+        allPoints = (vPoints, bPoints, gPoints, rPoints)
+        lookupTable = self.tableCache.get(
+            ('BGR', length, np.dtype(dtype).str)
+            + tuple(_pointsKey(points) for points in allPoints),
+            lambda : BGRFuncFilter(
+                *(utils.createCurveFunc(points) for points in allPoints),
+                dtype = dtype,
+                bits = bits
+            ).lookupTable
         )
+        LookupTableFilter.__init__(self, lookupTable)
 
 
 class BGRPortraCurveFilter(BGRCurveFilter):
     """A filter that applies Portra-like curves to BGR."""
 
-    def __init__(self, dtype = np.uint8):
+    def __init__(self, dtype = np.uint8, bits = None):
         super().__init__(
             vPoints = [(0,0),(23,20),(157,173),(255,255)],
             bPoints = [(0,0),(41,46),(231,228),(255,255)],
             gPoints = [(0,0),(52,47),(189,196),(255,255)],
             rPoints = [(0,0),(69,69),(213,218),(255,255)],
-            dtype = dtype
+            dtype = dtype,
+            bits = bits,
+            pointsRange = 256
         )
 
 
 class BGRProviaCurveFilter(BGRCurveFilter):
     """A filter that applies Provia-like curves to BGR."""
 
-    def __init__(self, dtype = np.uint8):
+    def __init__(self, dtype = np.uint8, bits = None):
         super().__init__(
             bPoints = [(0,0),(35,25),(205,227),(255,255)],
             gPoints = [(0,0),(27,21),(196,207),(255,255)],
             rPoints = [(0,0),(59,54),(202,210),(255,255)],
-            dtype = dtype
+            dtype = dtype,
+            bits = bits,
+            pointsRange = 256
         )
 
 
 class BGRVelviaCurveFilter(BGRCurveFilter):
     """A filter that applies Velvia-like curves to BGR."""
 
-    def __init__(self, dtype = np.uint8):
+    def __init__(self, dtype = np.uint8, bits = None):
         super().__init__(
             vPoints = [(0,0),(128,118),(221,215),(255,255)],
             bPoints = [(0,0),(25,21),(122,153),(165,206),(255,255)],
             gPoints = [(0,0),(25,21),(95,102),(181,208),(255,255)],
             rPoints = [(0,0),(41,28),(183,209),(255,255)],
-            dtype = dtype
+            dtype = dtype,
+            bits = bits,
+            pointsRange = 256
         )
 
 
 class BGRCrossProcessCurveFilter(BGRCurveFilter):
     """A filter that applies cross-process-like curves to BGR."""
 
-    def __init__(self, dtype = np.uint8):
+    def __init__(self, dtype = np.uint8, bits = None):
         super().__init__(
             bPoints = [(0,20),(255,235)],
             gPoints = [(0,0),(56,39),(208,226),(255,255)],
             rPoints = [(0,0),(56,22),(211,255),(255,255)],
-            dtype = dtype
+            dtype = dtype,
+            bits = bits,
+            pointsRange = 256
         )
 
 class StrokeEdgesFilter(Filter) :
+    """Darken the edges of the image.
+
+    scale < 1 computes the edge map on a reduced image, then upsamples it
+    to blend with the full resolution source.
+    """
 
-    def __init__(self, blurKsize=7, edgeKsize=5) :
+    def __init__(self, blurKsize=7, edgeKsize=5, scale=1.0) :
 
         self.blurKsize = blurKsize
         self.edgeKsize = edgeKsize
+        self.scale = scale
+
+    @property
+    def halo(self) :
+        halo = self.blurKsize // 2 + self.edgeKsize // 2
+        if self.scale < 1 :
+            halo = int(halo / self.scale) + 2
+        return halo
 
     def apply(self, src, dst):
 
-        if self.blurKsize >= 3:
-            blurredSrc = cv.medianBlur(src, self.blurKsize)
-            graySrc = cv.cvtColor(blurredSrc, cv.COLOR_BGR2GRAY)
+        work = src
+        blurKsize = self.blurKsize
+        if self.scale < 1 :
+            work = self.downscale(src, self.scale)
+            blurKsize = utils.scaleKsize(blurKsize, self.scale)
+
+        if blurKsize >= 3:
+            blurredSrc = self.buffers.like('blurred', work)
+            cv.medianBlur(work, blurKsize, blurredSrc)
+            graySrc = self.gray(blurredSrc)
         else:
-            graySrc = cv.cvtColor(src, cv.COLOR_BGR2GRAY)
+            graySrc = self.gray(work)
 
-        cv.Laplacian(graySrc, cv.CV_8U, graySrc, ksize=self.edgeKsize)
-        normalizedInverseAlpha = (1.0 / 255) * (255 - graySrc)
-        channels = cv.split(src)
+        edges = self.buffers.like('edges', graySrc)
+        cv.Laplacian(graySrc, cv.CV_8U, edges, ksize=self.edgeKsize)
 
-        for channel in channels:
-            channel[:] = channel * normalizedInverseAlpha
+        if self.scale < 1 :
+            edges = self.upscale(edges, src)
 
-        cv.merge(channels, dst)
+        # inverse alpha in 8-bit fixed point : 255 - edges
+        cv.bitwise_not(edges, edges)
+        self.blend(src, edges, dst)
 
 
 class CannyEdgesFilter(Filter) :
+    """Canny edges, alone or darkening the image (overlay).
+
+    scale < 1 detects the edges on a reduced image, then upsamples them.
+    """
 
-    def __init__(self, threshold=10, apertureSize=3, overlay=False) :
+    def __init__(self, threshold=10, apertureSize=3, overlay=False, scale=1.0) :
         self._threshold = threshold
         self._apertureSize = apertureSize
         self._overlay = overlay
+        self.scale = scale
+
+    @property
+    def halo(self) :
+        # sobel aperture and hysteresis neighbours (the hysteresis may
+        # follow an edge further : stripe borders may differ slightly)
+        halo = self._apertureSize // 2 + 2
+        if self.scale < 1 :
+            halo = int(halo / self.scale) + 2
+        return halo
 
     def apply(self, src, dst) :
 
         assert src.shape == dst.shape
 
-        if utils.isGray(src) :
-            gray = src
-        else :
-            gray = cv.cvtColor(src, cv.COLOR_BGR2GRAY)
+        work = src
+        if self.scale < 1 :
+            work = self.downscale(src, self.scale)
+
+        gray = self.gray(work)
 
-        cedge = cv.Canny(
+        cedge = self.buffers.like('edges', gray)
+        cv.Canny(
             gray,
             self._threshold,
             self._threshold * 3,
+            cedge,
             apertureSize=self._apertureSize
         )
-        alpha = (1.0 / 255) * (255 - cedge)
 
-        channels = cv.split(src)
+        if self.scale < 1 :
+            cedge = self.upscale(cedge, src)
 
-        for channel in channels :
-            if self._overlay :
-                channel[:] = channel * alpha
+        if not self._overlay :
+            if utils.isGray(dst) :
+                dst[...] = cedge
             else :
-                channel[:] = cedge
+                cv.cvtColor(cedge, cv.COLOR_GRAY2BGR, dst)
+            return
 
-        cv.merge(channels, dst)
+        # inverse alpha in 8-bit fixed point : 255 - edges
+        cv.bitwise_not(cedge, cedge)
+        self.blend(src, cedge, dst)
 
 
 class ThresholdFilter(Filter) :
@@ -267,22 +505,22 @@ class ThresholdFilter(Filter) :
 
     def apply(self, src, dst) :
 
-        if utils.isGray(src) :
-            gray = src
-        else :
-            gray = cv.cvtColor(src, cv.COLOR_BGR2GRAY)
+        gray = self.gray(src)
+        thresh = self.buffers.like('thresh', gray)
 
         if self._otsu :
             th, thresh = cv.threshold(
                 gray,
                 0, self._max,
-                cv.THRESH_BINARY + cv.THRESH_OTSU
+                cv.THRESH_BINARY + cv.THRESH_OTSU,
+                thresh
             )    
         else :
             th, thresh = cv.threshold(
                 gray,
                 self._threshold, self._max,
-                cv.THRESH_BINARY
+                cv.THRESH_BINARY,
+                thresh
             )
 
         cv.merge((thresh, thresh, thresh), dst)
@@ -294,19 +532,21 @@ class AdaptiveGaussianThresholdFilter(Filter) :
         self._size = size
         self._c = c
 
+    @property
+    def halo(self) :
+        return self._size // 2
+
     def apply(self, src, dst) :
 
-        if utils.isGray(src) :
-            gray = src
-        else :
-            gray = cv.cvtColor(src, cv.COLOR_BGR2GRAY)
+        gray = self.gray(src)
 
         thresh = cv.adaptiveThreshold(
                 gray,
                 self._max,
                 cv.ADAPTIVE_THRESH_GAUSSIAN_C,
                 cv.THRESH_BINARY,
-                self._size, self._c
+                self._size, self._c,
+                self.buffers.like('thresh', gray)
             )
 
         cv.merge((thresh, thresh, thresh), dst)
@@ -318,45 +558,340 @@ class AdaptiveMeanThresholdFilter(Filter) :
         self._size = size
         self._c = 2
 
+    @property
+    def halo(self) :
+        return self._size // 2
+
     def apply(self, src, dst) :
 
-        if utils.isGray(src) :
-            gray = src
-        else :
-            gray = cv.cvtColor(src, cv.COLOR_BGR2GRAY)
+        gray = self.gray(src)
 
         thresh = cv.adaptiveThreshold(
                 gray,
                 self._max,
                 cv.ADAPTIVE_THRESH_MEAN_C,
                 cv.THRESH_BINARY,
-                self._size, self._c
+                self._size, self._c,
+                self.buffers.like('thresh', gray)
             )
 
         cv.merge((thresh, thresh, thresh), dst)
 
         
 class GaussianBlurFilter(Filter) :
+    """Gaussian blur.
+
+    scale < 1 blurs a reduced image with a reduced kernel, then upsamples
+    the result.
+    """
 
-    def __init__(self, kernel=(5,5)) :
+    def __init__(self, kernel=(5,5), scale=1.0) :
         self._kernel = kernel
+        self.scale = scale
+
+    @property
+    def halo(self) :
+        halo = self._kernel[1] // 2
+        if self.scale < 1 :
+            halo += int(1 / self.scale) + 2
+        return halo
+
+    @property
+    def columnHalo(self) :
+        halo = self._kernel[0] // 2
+        if self.scale < 1 :
+            halo += int(1 / self.scale) + 2
+        return halo
+
+    def apply(self, src, dst) :
+        if self.scale >= 1 :
+            cv.GaussianBlur(src, self._kernel, 0, dst)
+            return
+
+        small = self.downscale(src, self.scale)
+        kernel = tuple(utils.scaleKsize(k, self.scale) for k in self._kernel)
+        cv.GaussianBlur(small, kernel, 0, small)
+        self.upscale(small, src, dst)
+
+
+class TemporalFilter(Filter) :
+    """Base of the filters combining the current frame with the previous
+    ones (temporal denoising).
+
+    The state is kept in buffers allocated once per resolution, a change
+    of resolution (or dtype) restarts from the current frame.
+    """
+
+    stateful = True
+
+    def __init__(self) :
+        self.reset()
+
+    def reset(self) :
+        """Forget the previous frames."""
+        self._count = 0
+        self._layout = None
+
+    def _restart(self, src) :
+        """Return True when the state must be restarted from src."""
+        layout = (src.shape, src.dtype)
+        if layout != self._layout :
+            self._layout = layout
+            self._count = 0
+        self._count += 1
+        return self._count == 1
+
+    @staticmethod
+    def _convert(accumulator, dst) :
+        """Round the float accumulator into dst."""
+        if dst.dtype == np.uint8 :
+            cv.convertScaleAbs(accumulator, dst)
+        else :
+            np.copyto(dst, np.rint(accumulator), casting = 'unsafe')
+
+
+class AverageTemporalFilter(TemporalFilter) :
+    """Exponential moving average of the frames.
+
+    dst = alpha * src + (1 - alpha) * previous dst
+    The lower alpha, the stronger the denoising (and the ghosting of the
+    moving objects, see MotionAdaptiveTemporalFilter).
+    """
+
+    def __init__(self, alpha=0.25) :
+        self.alpha = alpha
+        super().__init__()
 
     def apply(self, src, dst) :
-        cv.GaussianBlur(src, self._kernel, 0, dst)
+        average = self.buffers.get('average', src.shape, np.float32)
+        if self._restart(src) :
+            np.copyto(average, src)
+        else :
+            cv.accumulateWeighted(src, average, self.alpha)
+        self._convert(average, dst)
+
+
+class MedianTemporalFilter(TemporalFilter) :
+    """Per-pixel median of the last frames.
+
+    Removes the noise spikes without blending the values, at the cost of
+    frames // 2 frames of latency on the moving objects.
+    The median is sorted by a network of cv.min / cv.max on preallocated
+    planes (np.median over a stack of frames is 30 times slower).
+    """
+
+    def __init__(self, frames=5) :
+        self.frames = frames
+        super().__init__()
+
+    def apply(self, src, dst) :
+        history = self.buffers.get('history', (self.frames,) + src.shape, src.dtype)
+        if self._restart(src) :
+            self._index = 0
+        history[self._index % self.frames] = src
+        self._index += 1
+
+        n = min(self._count, self.frames)
+        if n < 3 :
+            if dst is not src :
+                np.copyto(dst, src)
+            return
+
+        planes = [ self.buffers.like('work%d' % k, src) for k in range(n + 1) ]
+        spare = planes.pop()
+        for k in range(n) :
+            np.copyto(planes[k], history[k])
+
+        # odd-even transposition sort
+        for step in range(n) :
+            for k in range(step % 2, n - 1, 2) :
+                cv.min(planes[k], planes[k + 1], spare)
+                cv.max(planes[k], planes[k + 1], planes[k + 1])
+                planes[k], spare = spare, planes[k]
+
+        np.copyto(dst, planes[(n - 1) // 2])
+
+
+class MotionAdaptiveTemporalFilter(TemporalFilter) :
+    """Exponential moving average, restarted on the moving pixels.
+
+    The pixels differing from the previous result by more than threshold
+    (gray level) take the current value : static areas are denoised, moving
+    objects leave no ghost.
+    """
+
+    def __init__(self, alpha=0.25, threshold=24) :
+        self.alpha = alpha
+        self.threshold = threshold
+        super().__init__()
+
+    def apply(self, src, dst) :
+        average = self.buffers.get('average', src.shape, np.float32)
+        previous = self.buffers.like('previous', src)
+        if self._restart(src) :
+            np.copyto(average, src)
+            np.copyto(previous, src)
+            if dst is not src :
+                np.copyto(dst, src)
+            return
+
+        diff = cv.absdiff(src, previous, self.buffers.like('diff', src))
+        if not utils.isGray(src) :
+            diff = cv.cvtColor(
+                diff, cv.COLOR_BGR2GRAY,
+                self.buffers.get('diffGray', src.shape[:2], src.dtype)
+            )
+        motion = self.buffers.get('motion', src.shape[:2])
+        still = self.buffers.get('still', src.shape[:2])
+        cv.compare(diff, self.threshold, cv.CMP_GT, motion)
+        cv.bitwise_not(motion, still)
+
+        cv.accumulateWeighted(src, average, self.alpha, still)
+        cv.accumulateWeighted(src, average, 1.0, motion)
+
+        self._convert(average, dst)
+        np.copyto(previous, dst)
+
+
+class ReducedResolutionFilter(Filter) :
+    """Run a filter at a reduced resolution.
+
+    Filters with a scale attribute (StrokeEdgesFilter, CannyEdgesFilter,
+    GaussianBlurFilter) reduce only their expensive part, the others run
+    on a reduced copy of the source and their result is upsampled.
+    budget (ms) : the scale is adjusted between minScale and maxScale to
+    keep the filter time under the budget.
+    """
+
+    def __init__(self, filter, scale=0.5, budget=None,
+                 minScale=0.25, maxScale=1.0) :
+        self.filter = filter
+        self.scale = scale
+        self.budget = budget
+        self.minScale = minScale
+        self.maxScale = maxScale
+        self._elapsed = None
+
+    def clone(self) :
+        clone = super().clone()
+        clone.filter = self.filter.clone()
+        return clone
+
+    @property
+    def scale(self) :
+        return self._scale
+
+    @scale.setter
+    def scale(self, scale) :
+        self._scale = scale
+        if hasattr(self.filter, 'scale') :
+            # the filter reduces its own expensive part
+            self.filter.scale = scale
+
+    def _reducedHalo(self, halo) :
+        if hasattr(self.filter, 'scale') or self.scale >= 1 :
+            return halo
+        # the reduced neighbourhood, and the resampling around it
+        return int(np.ceil(halo / self.scale)) + 2
+
+    @property
+    def halo(self) :
+        return self._reducedHalo(self.filter.halo)
+
+    @property
+    def columnHalo(self) :
+        return self._reducedHalo(self.filter.columnHalo)
+
+    @property
+    def positional(self) :
+        return self.filter.positional
+
+    @property
+    def stateful(self) :
+        return self.filter.stateful
+
+    def apply(self, src, dst) :
+        t1 = cv.getTickCount()
+
+        if hasattr(self.filter, 'scale') or self.scale >= 1 :
+            self.filter.apply(src, dst)
+        else :
+            small = self.downscale(src, self.scale)
+            smallDst = self.buffers.like('smallDst', small)
+            self.filter.apply(small, smallDst)
+            self.upscale(smallDst, src, dst)
+
+        if self.budget is not None :
+            elapsed = (cv.getTickCount() - t1) * 1000.0 / cv.getTickFrequency()
+            self._adapt(elapsed)
+
+    def _adapt(self, elapsed) :
+        # smoothed filter time, measured again after each change
+        if self._elapsed is None :
+            self._elapsed = elapsed
+            return
+        self._elapsed = 0.8 * self._elapsed + 0.2 * elapsed
+
+        # the cost grows like scale ** 2 : 0.8 ** 2 leaves some margin
+        if self._elapsed > self.budget and self.scale > self.minScale :
+            self.scale = max(self.minScale, self.scale * 0.8)
+            self._elapsed = None
+        elif self._elapsed < 0.6 * self.budget and self.scale < self.maxScale :
+            self.scale = min(self.maxScale, self.scale / 0.8)
+            self._elapsed = None
 
         
 class VConvolutionFilter(Filter) :
-    """A filter that applies a convolution to V (or all of BGR)."""
+    """A filter that applies a convolution to V (or all of BGR).
+
+    The kernel (any size) is analyzed once : a mean or sum kernel runs
+    with cv.boxFilter, a separable (rank 1) kernel with cv.sepFilter2D,
+    the others with cv.filter2D. method forces one of 'box',
+    'separable' or 'filter2D' when the kernel allows it.
+    """
 
-    def __init__(self, kernel):
+    def __init__(self, kernel, method = None):
         super().__init__()
         self._kernel = kernel
+        self._method = 'filter2D'
+
+        kernel = np.asarray(kernel, dtype = np.float64)
+        weight = kernel.flat[0]
+        if (method in (None, 'box') and utils.isUniformKernel(kernel)
+            and (abs(weight * kernel.size - 1) < 1e-6 or weight == 1)) :
+            # mean (normalized) or sum of the neighbourhood
+            self._method = 'box'
+            self._ksize = (kernel.shape[1], kernel.shape[0])
+            self._normalize = weight != 1
+        elif method in (None, 'separable') :
+            separated = utils.separateKernel(kernel)
+            if separated is not None :
+                self._method = 'separable'
+                self._kernelX, self._kernelY = separated
+
+    @property
+    def method(self) :
+        return self._method
+
+    @property
+    def halo(self) :
+        return np.shape(self._kernel)[0] // 2
+
+    @property
+    def columnHalo(self) :
+        return np.shape(self._kernel)[1] // 2
 
     def apply(self, src, dst):
         """Apply the filter with a BGR or gray source/destination."""
         assert src.shape == dst.shape
 
-        cv.filter2D(src, -1, self._kernel, dst)
+        if self._method == 'box' :
+            cv.boxFilter(src, -1, self._ksize, dst,
+                         normalize = self._normalize)
+        elif self._method == 'separable' :
+            cv.sepFilter2D(src, -1, self._kernelX, self._kernelY, dst)
+        else :
+            cv.filter2D(src, -1, self._kernel, dst)
 
 
 class SharpenFilter(VConvolutionFilter):
@@ -384,16 +919,11 @@ class FindEdgesFilter(VConvolutionFilter):
 
 
 class BlurFilter(VConvolutionFilter):
-    """A blur filter with a 2-pixel radius."""
+    """A blur filter with a 2-pixel radius (or the given radius)."""
 
-    def __init__(self):
-        kernel = np.array([
-            [0.04, 0.04, 0.04, 0.04, 0.04],
-            [0.04, 0.04, 0.04, 0.04, 0.04],
-            [0.04, 0.04, 0.04, 0.04, 0.04],
-            [0.04, 0.04, 0.04, 0.04, 0.04],
-            [0.04, 0.04, 0.04, 0.04, 0.04]
-        ])
+    def __init__(self, radius = 2):
+        size = 2 * radius + 1
+        kernel = np.full((size, size), 1.0 / (size * size))
         super().__init__(kernel)
 
 
@@ -407,3 +937,407 @@ class EmbossFilter(VConvolutionFilter):
             [ 0,  1, 2]
         ])
         super().__init__(kernel)
+
+
+class FilterChain(Filter) :
+    """A filter that applies a list of filters in order.
+
+    Consecutive lookup table filters (curves) are folded into one table.
+    A convolution filter following a smoothing one (non-negative weights
+    summing to at most 1, so that its result never saturates) is folded
+    into one kernel (fuseConvolutions) : the result only differs by the
+    rounding of the intermediate image.
+    The first filter writes to the destination, the others run in place.
+    """
+
+    def __init__(self, filters = (), fuseConvolutions = True) :
+        self.filters = []
+        for f in filters :
+            # nested chains are flattened
+            if isinstance(f, FilterChain) :
+                self.filters.extend(f.filters)
+            else :
+                self.filters.append(f)
+        self.fuseConvolutions = fuseConvolutions
+        self.stages = self._fuse(self.filters)
+
+    def clone(self) :
+        clone = super().clone()
+        clone.filters = [ f.clone() for f in self.filters ]
+        clone.stages = clone._fuse(clone.filters)
+        return clone
+
+    @property
+    def halo(self) :
+        # the neighbourhoods of the stages add up
+        return sum(stage.halo for stage in self.stages)
+
+    @property
+    def columnHalo(self) :
+        return sum(stage.columnHalo for stage in self.stages)
+
+    @property
+    def align(self) :
+        return math.lcm(1, *(stage.align for stage in self.stages))
+
+    @property
+    def positional(self) :
+        return any(f.positional for f in self.filters)
+
+    @property
+    def stateful(self) :
+        return any(f.stateful for f in self.filters)
+
+    def _fuse(self, filters) :
+        stages = []
+        for f in filters :
+            last = stages[-1] if stages else None
+            if (isinstance(f, LookupTableFilter)
+                and isinstance(last, LookupTableFilter)) :
+                stages[-1] = LookupTableFilter(
+                    utils.composeLookupTables(last.lookupTable, f.lookupTable)
+                )
+            elif (self.fuseConvolutions
+                  and isinstance(f, VConvolutionFilter)
+                  and isinstance(last, VConvolutionFilter)
+                  and utils.isSmoothingKernel(last._kernel)) :
+                stages[-1] = VConvolutionFilter(
+                    utils.composeKernels(last._kernel, f._kernel)
+                )
+            else :
+                stages.append(f)
+        return stages
+
+    def apply(self, src, dst) :
+        """Apply the filters with a BGR or gray source/destination."""
+
+        if not self.stages :
+            if dst is not src :
+                dst[...] = src
+            return
+
+        self.stages[0].apply(src, dst)
+        for stage in self.stages[1:] :
+            stage.apply(dst, dst)
+
+
+class RegionFilter(Filter) :
+    """A filter applied only on some regions of the image.
+
+    rects : list of (x, y, w, h), and/or mask : binary image
+    (with a mask only, its bounding rects are the regions).
+    The filter works on views of the regions (no copy). Outside of the
+    regions dst is left untouched, or gets the source (passThrough).
+    Inside of a rect, a mask restricts the pixels written to dst.
+    Each region gets its own copy of the filter, so that the scratch
+    buffers are not reallocated from one region to the other.
+    """
+
+    # the rects and the mask are in frame coordinates
+    positional = True
+
+    def __init__(self, filter, rects = None, mask = None, passThrough = True) :
+        self.filter = filter
+        self.rects = rects
+        self.mask = mask
+        self.passThrough = passThrough
+        self._filters = []
+
+    def clone(self) :
+        clone = super().clone()
+        clone.filter = self.filter.clone()
+        clone._filters = []
+        return clone
+
+    @property
+    def halo(self) :
+        return self.filter.halo
+
+    @property
+    def columnHalo(self) :
+        return self.filter.columnHalo
+
+    @property
+    def align(self) :
+        return self.filter.align
+
+    @property
+    def stateful(self) :
+        return self.filter.stateful
+
+    def _regionFilter(self, n) :
+        while len(self._filters) <= n :
+            self._filters.append(self.filter.clone())
+        return self._filters[n]
+
+    def apply(self, src, dst) :
+        """Apply the filter on the regions of a BGR or gray source."""
+
+        if self.passThrough and dst is not src :
+            np.copyto(dst, src)
+
+        regions = utils.regionViews(self.rects, self.mask, src, dst)
+        for n, (rect, (roiSrc, roiDst), roiMask) in enumerate(regions) :
+            f = self._regionFilter(n)
+            if roiMask is None :
+                f.apply(roiSrc, roiDst)
+                continue
+
+            # filter the rect into a scratch buffer, keep the masked pixels
+            result = self.buffers.like('region{}'.format(n), roiSrc)
+            f.apply(roiSrc, result)
+            cv.copyTo(result, roiMask, roiDst)
+
+
+class StripeFilter(Filter) :
+    """A filter applied on horizontal stripes of the image, in parallel.
+
+    Each stripe is a view of the image, extended by halo rows on each
+    side for the filters needing neighbours (default: filter.halo).
+    The stripes run in a pool of threads, each one with its own copy of
+    the filter (see Filter.clone), then their rows are written to the
+    destination.
+    Filters using global statistics (Otsu threshold) give per-stripe
+    results. Positional filters (RegionFilter) are refused.
+    """
+
+    def __init__(self, filter, stripes = None, halo = None, workers = None) :
+        if filter.positional :
+            raise ValueError('positional filter', filter)
+        self.filter = filter
+        self.workers = workers or multiprocessing.cpu_count()
+        self.stripes = stripes or self.workers
+        self._halo = halo
+        self._filters = [ filter.clone() for n in range(self.stripes) ]
+        self._executor = None
+
+    def clone(self) :
+        return StripeFilter(
+            self.filter.clone(), self.stripes, self._halo, self.workers
+        )
+
+    @property
+    def halo(self) :
+        if self._halo is not None :
+            return self._halo
+        # the copies may adapt their scale (ReducedResolutionFilter budget)
+        return max(f.halo for f in self._filters)
+
+    @property
+    def columnHalo(self) :
+        # the stripes span the whole rows : for the filters around them
+        return max(f.columnHalo for f in self._filters)
+
+    def _bounds(self, rows) :
+        """(top, bottom) rows of each stripe"""
+        edges = np.linspace(0, rows, self.stripes + 1).astype(int)
+        return [
+            (top, bottom)
+            for top, bottom in zip(edges[:-1], edges[1:])
+            if bottom > top
+        ]
+
+    @property
+    def align(self) :
+        # a grid common to the copies, whatever their scale
+        return math.lcm(1, *(f.align for f in self._filters))
+
+    @property
+    def stateful(self) :
+        return self.filter.stateful
+
+    def _applyStripe(self, n, src, dst, top, bottom, halo, align) :
+        f = self._filters[n]
+        if not halo and align == 1 :
+            # point operation : straight from view to view
+            f.apply(src[top:bottom], dst[top:bottom])
+            return None
+
+        start = max(0, top - halo) // align * align
+        stop = min(src.shape[0], -(-(bottom + halo) // align) * align)
+        stripe = src[start:stop]
+        result = f.buffers.like('stripe', stripe)
+        f.apply(stripe, result)
+        return result[top - start:bottom - start]
+
+    def apply(self, src, dst) :
+        """Apply the filter with a BGR or gray source/destination."""
+
+        if self._executor is None :
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix='StripeFilter'
+            )
+
+        halo = self.halo
+        align = self.align
+        bounds = self._bounds(src.shape[0])
+        futures = [
+            self._executor.submit(
+                self._applyStripe, n, src, dst, top, bottom, halo, align
+            )
+            for n, (top, bottom) in enumerate(bounds)
+        ]
+
+        # the stripes with a halo read the rows of their neighbours :
+        # dst (maybe src) is written only when every stripe is done
+        results = [ future.result() for future in futures ]
+        for (top, bottom), result in zip(bounds, results) :
+            if result is not None :
+                dst[top:bottom] = result
+
+    def close(self) :
+        if self._executor is not None :
+            self._executor.shutdown()
+            self._executor = None
+
+
+class DirtyTileFilter(Filter) :
+    """A filter applied only on the tiles which changed since the last frame.
+
+    A tile is dirty when one of its samples differs by more than threshold
+    (in source levels : uint8 or uint16) from the source of the current
+    result; the tiles within the filter halo of a dirty tile are dirty
+    too. Each dirty tile is filtered in a window extended by the halo
+    rows and columns (default: filter.halo and filter.columnHalo, a given
+    halo is used for both) and patched into an output kept between
+    frames. Each window size (inner, border and corner tiles) has its own
+    copy of the filter, so that the filter buffers are reused.
+    maxDirty : above this fraction of dirty tiles, the whole frame is
+               filtered at once
+    Small changes under threshold add up until they refresh their tile.
+    Filters using global statistics (Otsu threshold, Canny hysteresis)
+    give per-window results. Positional filters (RegionFilter) are
+    refused.
+    """
+
+    def __init__(self, filter, tile = (64, 64), threshold = 8, halo = None,
+                 maxDirty = 0.5) :
+        if filter.positional :
+            raise ValueError('positional filter', filter)
+        self.filter = filter
+        self.tile = tile
+        self.threshold = threshold
+        self.maxDirty = maxDirty
+        self._halo = halo
+        self.reset()
+
+    def clone(self) :
+        return DirtyTileFilter(
+            self.filter.clone(), self.tile, self.threshold, self._halo,
+            self.maxDirty
+        )
+
+    @property
+    def halo(self) :
+        return self.filter.halo if self._halo is None else self._halo
+
+    @property
+    def columnHalo(self) :
+        return self.filter.columnHalo if self._halo is None else self._halo
+
+    @property
+    def align(self) :
+        return self.filter.align
+
+    @property
+    def stateful(self) :
+        return self.filter.stateful
+
+    def reset(self) :
+        """Filter the whole next frame."""
+        self._layout = None
+        self._windowFilters = {}
+        self.tilesFiltered = 0
+        self.tilesSkipped = 0
+
+    def _windowFilter(self, shape) :
+        f = self._windowFilters.get(shape)
+        if f is None :
+            f = self._windowFilters[shape] = self.filter.clone()
+        return f
+
+    def _dirtyTiles(self, src) :
+        """Boolean grid of the dirty tiles."""
+        tw, th = self.tile
+        rows, cols = self._grid
+        samples = 1 if utils.isGray(src) else src.shape[2]
+
+        # the difference goes into a buffer of whole tiles, its padding
+        # is zeroed when the layout changes (see apply)
+        padded = self.buffers.get(
+            'diff', (rows * th, cols * tw) + src.shape[2:], src.dtype
+        )
+        cv.absdiff(
+            src, self.buffers.like('reference', src),
+            padded[:src.shape[0], :src.shape[1]]
+        )
+
+        # max per tile : over the rows of each band, then each tile
+        bands = self.buffers.get('bands', (rows, cols * tw * samples), src.dtype)
+        np.max(padded.reshape(rows, th, -1), axis = 1, out = bands)
+        tiles = self.buffers.get('tiles', (rows, cols), src.dtype)
+        np.max(bands.reshape(rows, cols, -1), axis = 2, out = tiles)
+
+        dirty = self.buffers.get('dirty', (rows, cols))
+        cv.compare(tiles, self.threshold, cv.CMP_GT, dirty)
+
+        # the neighbours within the halo see the change
+        reachY = -(-self.halo // th)
+        reachX = -(-self.columnHalo // tw)
+        if reachY or reachX :
+            kernel = np.ones((2 * reachY + 1, 2 * reachX + 1), np.uint8)
+            cv.dilate(dirty, kernel, dirty)
+        return dirty
+
+    def apply(self, src, dst) :
+        """Apply the filter with a BGR or gray source/destination."""
+
+        output = self.buffers.like('output', src)
+        reference = self.buffers.like('reference', src)
+        tw, th = self.tile
+        height, width = src.shape[:2]
+        self._grid = (-(-height // th), -(-width // tw))
+
+        layout = (src.shape, src.dtype)
+        if layout != self._layout :
+            self._layout = layout
+            self._windowFilters = {}
+            self.buffers.get(
+                'diff', (self._grid[0] * th, self._grid[1] * tw) + src.shape[2:],
+                src.dtype
+            )[...] = 0
+            dirty = None
+        else :
+            dirty = self._dirtyTiles(src)
+
+        count = dirty.size if dirty is not None else 0
+        if dirty is None or np.count_nonzero(dirty) > self.maxDirty * count :
+            self.filter.apply(src, output)
+            np.copyto(reference, src)
+            np.copyto(dst, output)
+            self.tilesFiltered += self._grid[0] * self._grid[1]
+            return
+
+        halo, columnHalo = self.halo, self.columnHalo
+        align = self.align
+        for row, col in zip(*np.nonzero(dirty)) :
+            y0, x0 = row * th, col * tw
+            y1, x1 = min(y0 + th, height), min(x0 + tw, width)
+            # the window starts on the sampling grid of the filter
+            wy0 = max(0, y0 - halo) // align * align
+            wx0 = max(0, x0 - columnHalo) // align * align
+            wy1 = min(height, -(-(y1 + halo) // align) * align)
+            wx1 = min(width, -(-(x1 + columnHalo) // align) * align)
+
+            window = src[wy0:wy1, wx0:wx1]
+            f = self._windowFilter(window.shape)
+            result = f.buffers.like('window', window)
+            f.apply(window, result)
+            output[y0:y1, x0:x1] = result[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0]
+            reference[y0:y1, x0:x1] = src[y0:y1, x0:x1]
+
+        filtered = int(np.count_nonzero(dirty))
+        self.tilesFiltered += filtered
+        self.tilesSkipped += count - filtered
+        np.copyto(dst, output)
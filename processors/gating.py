@@ -0,0 +1,106 @@
+# -*- encoding: utf8 -*-
+
+import cv2 as cv
+import numpy as np
+
+from .core import FrameProcessor
+from . import utils
+
+__all__ = [ 'StaticSceneProcessor' ]
+
+# ------------------------------------------------------------------------------
+
+class StaticSceneProcessor(FrameProcessor) :
+    """
+    Run a FrameProcessor only when the scene changes
+    The signature of a frame is a small gray thumbnail. While it differs
+    from the one of the last processed frame by less than threshold (mean
+    absolute difference, in gray levels), the last result is given again
+    instead of running the processor.
+    refresh : the processor runs at least once every refresh frames
+    Stateful processors (background subtraction, counters) only see the
+    processed frames.
+    """
+
+    def __init__(self, processor, threshold=2.0, refresh=30, size=(32, 24)) :
+        self.processor = processor
+        self.threshold = threshold
+        self.refresh = refresh
+        self.size = size
+        self._buffers = utils.BufferPool()
+        self._result = None
+        self._layout = None
+        self._skipped = 0
+        self.framesSkipped = 0
+        self.framesProcessed = 0
+        super().__init__()
+
+    @property
+    def stateful(self) :
+        return self.processor.stateful
+
+    def params(self, **kwargs) :
+        for name in ('threshold', 'refresh', 'size') :
+            if name in kwargs :
+                setattr(self, name, kwargs[name])
+        self.reset()
+
+    def reset(self) :
+        """Process the next frame whatever it is."""
+        self._result = None
+
+    def signature(self, frame) :
+        """Small gray thumbnail of frame (buffer reused between calls)"""
+        small = cv.resize(
+            frame, self.size,
+            self._buffers.get('small', (self.size[1], self.size[0]) + frame.shape[2:]),
+            interpolation=cv.INTER_AREA
+        )
+        if utils.isGray(small) :
+            return small
+        return cv.cvtColor(
+            small, cv.COLOR_BGR2GRAY,
+            self._buffers.get('signature', (self.size[1], self.size[0]))
+        )
+
+    def distance(self, signature) :
+        """Mean absolute difference with the last processed frame"""
+        reference = self._buffers.like('reference', signature)
+        diff = cv.absdiff(signature, reference, self._buffers.like('diff', signature))
+        return cv.mean(diff)[0]
+
+    def apply(self, frame, context) :
+        signature = self.signature(frame)
+
+        if (self._result is not None
+            and self._skipped < self.refresh - 1
+            and self._layout == (frame.shape, frame.dtype)
+            and self.distance(signature) < self.threshold) :
+
+            self._skipped += 1
+            self.framesSkipped += 1
+            # a copy : the next stages may draw on it
+            if self._result.shape == frame.shape :
+                np.copyto(frame, self._result)
+                return frame
+            output = self._buffers.like('output', self._result)
+            np.copyto(output, self._result)
+            return output
+
+        result = self.processor.apply(frame, context)
+        if result is None :
+            result = frame
+
+        np.copyto(self._buffers.like('reference', signature), signature)
+        self._result = self._buffers.like('result', result)
+        np.copyto(self._result, result)
+        self._layout = (frame.shape, frame.dtype)
+        self._skipped = 0
+        self.framesProcessed += 1
+        return result
+
+    def results(self) :
+        # a skipped frame is given the result of the last processed one
+        return self.processor.results()
+
+# ------------------------------------------------------------------------------
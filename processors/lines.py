@@ -12,6 +12,8 @@ __all__ = [ 'LinesProcessor' ]
 
 class LinesProcessor(FrameProcessor) :
 
+    _results = None
+
     def params(self, **kwargs) :
         self.minLineLength = kwargs.get('minLineLength', 10)
         self.maxLineGap = kwargs.get('maxLineGap', 3)
@@ -30,6 +32,14 @@ class LinesProcessor(FrameProcessor) :
             for x1,y1,x2,y2 in lines[:,0] :
                 cv.line(frame, (x1,y1), (x2,y2), (0, 255, 0))
 
+        # (x1, y1, x2, y2) in the returned (resized) frame
+        self._results = dict(lines=[
+            [ int(v) for v in line ]
+            for line in (lines[:,0] if lines is not None else [])
+        ])
         return frame
 
+    def results(self) :
+        return self._results
+
 # ------------------------------------------------------------------------------
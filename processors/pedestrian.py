@@ -13,6 +13,8 @@ __all__ = [ 'PedestrianProcessor' ]
 
 class PedestrianProcessor(FrameProcessor) :
 
+    _results = None
+
     def __init__(self) :
         self.hog = cv.HOGDescriptor()
         self.hog.setSVMDetector(cv.HOGDescriptor_getDefaultPeopleDetector())
@@ -44,6 +46,13 @@ class PedestrianProcessor(FrameProcessor) :
         for (xA, yA, xB, yB) in pick :
             cv.rectangle(frame, (xA, yA), (xB, yB), (0, 255, 0), 2)
 
+        # boxes (x1, y1, x2, y2) in the returned (resized) frame
+        self._results = dict(
+            pedestrians=[ [ int(v) for v in box ] for box in pick ]
+        )
         return frame
+
+    def results(self) :
+        return self._results
         
 # ------------------------------------------------------------------------------
@@ -0,0 +1,268 @@
+# -*- encoding: utf8 -*-
+
+import collections
+import concurrent.futures
+import multiprocessing
+import types
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .core import FrameProcessor
+
+__all__ = [ 'ProcessPoolProcessor' ]
+
+# ------------------------------------------------------------------------------
+
+POOL_ORDERED = 'ordered'
+POOL_LATEST = 'latest'
+
+# ------------------------------------------------------------------------------
+# worker side : one processor instance per worker process
+
+_worker = {}
+
+def _init_worker(factory, kwargs) :
+    processor = factory()
+    if kwargs :
+        processor.params(**kwargs)
+    _worker['processor'] = processor
+    _worker['generation'] = None
+    _worker['shm'] = {}
+
+def _attach(generation, name) :
+    if generation != _worker['generation'] :
+        # forget the segments of a previous allocation
+        for old in _worker['shm'].values() :
+            old.close()
+        _worker['shm'].clear()
+        _worker['generation'] = generation
+    shm = _worker['shm'].get(name)
+    if shm is None :
+        shm = shared_memory.SharedMemory(name=name)
+        _worker['shm'][name] = shm
+    return shm
+
+def _process(generation, src_name, dst_name, shape, dtype, context) :
+    src = _attach(generation, src_name)
+    dst = _attach(generation, dst_name)
+
+    frame = np.ndarray(shape, dtype, buffer=src.buf)
+    result = _worker['processor'].apply(frame, context)
+    results = _worker['processor'].results()
+
+    if result is None :
+        result = frame
+
+    del frame
+
+    # send the result back through the output slot when it fits
+    if result.nbytes <= dst.size :
+        out = np.ndarray(result.shape, result.dtype, buffer=dst.buf)
+        out[...] = result
+        del out
+        return result.shape, result.dtype.str, None, results
+
+    return None, None, result, results
+
+# ------------------------------------------------------------------------------
+
+class ProcessPoolProcessor(FrameProcessor) :
+    """
+    Run a FrameProcessor in a pool of worker processes.
+    factory : picklable callable building the processor in each worker
+              (usually the processor class), kwargs are given to its params()
+    Frames go to the workers through shared memory slots.
+    policy POOL_ORDERED : apply() returns the results in frame order,
+                          None while the pipeline fills up
+    policy POOL_LATEST : apply() returns the latest available result,
+                         frames are skipped when every worker is busy
+    Only stateless processors can run in the pool : each worker sees a
+    part of the frames, a processor keeping state between frames
+    (background subtraction, tracking, temporal filters) would give wrong
+    results. A processor is built in the calling process to check it.
+    close() stops the workers, the pool is also a context manager.
+    """
+
+    def __init__(self, factory, workers=None, policy=POOL_LATEST, **kwargs) :
+        if policy not in (POOL_ORDERED, POOL_LATEST) :
+            raise ValueError('unknown pool policy', policy)
+
+        probe = factory()
+        if kwargs :
+            probe.params(**kwargs)
+        if probe.stateful :
+            raise ValueError('stateful processor', probe)
+        del probe
+
+        self.factory = factory
+        self.kwargs = kwargs
+        self.workers = workers or multiprocessing.cpu_count()
+        self.policy = policy
+
+        self._executor = None
+        self._slots = []
+        self._free = collections.deque()
+        self._capacity = 0
+        self._generation = 0
+        self._pending = collections.deque()
+        self._ready = collections.deque()
+        self._latest = None
+        self._results = None
+        self._submitted = 0
+
+        self.framesDropped = 0
+        super().__init__()
+
+    def params(self, **kwargs) :
+        # the parameters are sent to the processors of the workers
+        if kwargs :
+            self.kwargs.update(kwargs)
+            self.close()
+
+    def _start(self) :
+        if self._executor is None :
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.factory, self.kwargs)
+            )
+
+    def _allocate(self, nbytes) :
+        """(Re)allocate the shared memory slots : 2 per worker, in and out"""
+        self._ready.extend(self._drain())
+        self._release_slots()
+        self._capacity = nbytes
+        self._generation += 1
+        for n in range(self.workers) :
+            self._slots.append((
+                shared_memory.SharedMemory(create=True, size=nbytes),
+                shared_memory.SharedMemory(create=True, size=nbytes)
+            ))
+            self._free.append(n)
+
+    def _release_slots(self) :
+        for src, dst in self._slots :
+            for shm in (src, dst) :
+                shm.close()
+                shm.unlink()
+        self._slots = []
+        self._free.clear()
+
+    @staticmethod
+    def _snapshot(context) :
+        """Picklable part of the context"""
+        return types.SimpleNamespace(**dict(
+            (name, getattr(context, name))
+            for name in ('frameno', 'fps')
+            if hasattr(context, name)
+        ))
+
+    def submit(self, frame, context=None) :
+        """
+        Send the frame to a worker, return False when no slot is free
+        """
+        self._start()
+        if frame.nbytes > self._capacity :
+            self._allocate(frame.nbytes)
+        if not self._free :
+            return False
+
+        index = self._free.popleft()
+        src, dst = self._slots[index]
+        slot = np.ndarray(frame.shape, frame.dtype, buffer=src.buf)
+        slot[...] = frame
+        del slot
+
+        future = self._executor.submit(
+            _process,
+            self._generation,
+            src.name, dst.name,
+            frame.shape, frame.dtype.str,
+            self._snapshot(context)
+        )
+        self._submitted += 1
+        self._pending.append((self._submitted, index, future))
+        return True
+
+    def _result(self, index, future) :
+        shape, dtype, result, results = future.result()
+        if result is None :
+            dst = self._slots[index][1]
+            result = np.ndarray(shape, dtype, buffer=dst.buf).copy()
+        self._free.append(index)
+        return result, results
+
+    def collect(self, block=False) :
+        """
+        Return the list of (frameno, result, results) ready, in frame
+        order, results being the processor results() for that frame.
+        block : wait for the oldest pending frame
+        """
+        ready = []
+        while self._pending :
+            frameno, index, future = self._pending[0]
+            if not future.done() and not (block and not ready) :
+                break
+            self._pending.popleft()
+            ready.append((frameno,) + self._result(index, future))
+        return ready
+
+    def _drain(self) :
+        results = []
+        while self._pending :
+            results.extend(self.collect(block=True))
+        return results
+
+    def flush(self) :
+        """
+        Wait for every pending frame, return the (frameno, result, results)
+        not returned yet, in frame order.
+        """
+        results = list(self._ready) + self._drain()
+        self._ready.clear()
+        return results
+
+    def apply(self, frame, context) :
+        if self.policy == POOL_ORDERED :
+            # wait for the oldest frames until a worker is free
+            while not self._free and self._pending :
+                self._ready.extend(self.collect(block=True))
+            self.submit(frame, context)
+            self._ready.extend(self.collect())
+            if not self._ready :
+                return None
+            frameno, result, self._results = self._ready.popleft()
+            return result
+
+        # latest available
+        if not self.submit(frame, context) :
+            self.framesDropped += 1
+        ready = self.collect()
+        if ready :
+            frameno, self._latest, self._results = ready[-1]
+        return self._latest if self._latest is not None else frame
+
+    def results(self) :
+        """Results of the frame returned by the last apply()"""
+        return self._results
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, *exc) :
+        self.close()
+
+    def close(self) :
+        """Stop the workers and free the shared memory."""
+        if self._executor is not None :
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        self._pending.clear()
+        self._ready.clear()
+        self._latest = None
+        self._results = None
+        self._release_slots()
+        self._capacity = 0
+
+# ------------------------------------------------------------------------------
@@ -0,0 +1,57 @@
+# -*- encoding: utf8 -*-
+
+import cv2 as cv
+
+from .core import FrameProcessor
+from . import utils
+
+__all__ = [ 'RegionProcessor' ]
+
+# ------------------------------------------------------------------------------
+
+class RegionProcessor(FrameProcessor) :
+    """
+    Run a FrameProcessor only on some regions of the frame
+    rects : list of (x, y, w, h), and/or mask : binary image
+    The processor gets a view of each region (no copy), its result is
+    written back into the region (resized if needed, restricted to the
+    mask if any). The rest of the frame is passed through.
+    """
+
+    def __init__(self, processor, rects=None, mask=None) :
+        self.processor = processor
+        self.rects = rects
+        self.mask = mask
+        super().__init__()
+
+    @property
+    def stateful(self) :
+        return self.processor.stateful
+
+    def params(self, **kwargs) :
+        if 'rects' in kwargs :
+            self.rects = kwargs['rects']
+        if 'mask' in kwargs :
+            self.mask = kwargs['mask']
+
+    def apply(self, frame, context) :
+        regions = utils.regionViews(self.rects, self.mask, frame)
+        for rect, (roi,), roiMask in regions :
+            result = self.processor.apply(roi, context)
+            if result is None or result is roi :
+                continue
+
+            # the processor returned a new (maybe resized) image
+            if result.shape[:2] != roi.shape[:2] :
+                result = cv.resize(result, (roi.shape[1], roi.shape[0]))
+            if result.ndim < roi.ndim :
+                result = cv.cvtColor(result, cv.COLOR_GRAY2BGR)
+
+            if roiMask is None :
+                roi[...] = result
+            else :
+                cv.copyTo(result, roiMask, roi)
+
+        return frame
+
+# ------------------------------------------------------------------------------
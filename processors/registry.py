@@ -0,0 +1,93 @@
+# -*- encoding: utf8 -*-
+
+import os
+import threading
+
+__all__ = [ 'FilterRegistry' ]
+
+# ------------------------------------------------------------------------------
+
+# lookup tables of the curve filters, kept across runs
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser('~'), '.cache', 'smile-in-the-light', 'luts'
+)
+
+# ------------------------------------------------------------------------------
+
+class FilterRegistry :
+    """
+    Named filter configurations, each one created once and then reused
+    registry.define('velvia', filters.BGRVelviaCurveFilter)
+    registry.define('canny', filters.CannyEdgesFilter, threshold=30)
+    registry.prewarm()
+    frame_filter = registry['velvia']
+    The filters are built outside of the lock : a slow filter does not
+    block the others.
+    """
+
+    def __init__(self, definitions=None) :
+        self._factories = {}
+        self._filters = {}
+        self._lock = threading.Lock()
+        self._prewarming = None
+
+        for key, factory, kwargs in (definitions or []) :
+            self.define(key, factory, **kwargs)
+
+    def define(self, key, factory, **kwargs) :
+        """Define (or redefine) the filter called key : factory(**kwargs)"""
+        with self._lock :
+            self._factories[key] = (factory, kwargs)
+            self._filters.pop(key, None)
+
+    def __contains__(self, key) :
+        return key in self._factories
+
+    def __iter__(self) :
+        return iter(self._factories)
+
+    def __getitem__(self, key) :
+        return self.get(key)
+
+    def get(self, key) :
+        """Return the filter called key, created on first use."""
+        with self._lock :
+            instance = self._filters.get(key)
+            definition = self._factories[key]
+        if instance is not None :
+            return instance
+
+        factory, kwargs = definition
+        instance = factory(**kwargs)
+
+        with self._lock :
+            if self._factories.get(key) is not definition :
+                # redefined meanwhile : not kept
+                return instance
+            # another thread may have built it meanwhile : keep the first
+            return self._filters.setdefault(key, instance)
+
+    def prewarm(self, keys=None, background=False) :
+        """
+        Create the filters (default: all) before their first use
+        background : create them in a thread, the ones not created yet
+                     when requested are created by get() as usual
+        """
+        keys = list(self._factories if keys is None else keys)
+        if not background :
+            for key in keys :
+                self.get(key)
+            return
+
+        self._prewarming = threading.Thread(
+            target=self.prewarm, args=(keys,),
+            name='FilterRegistry.prewarm', daemon=True
+        )
+        self._prewarming.start()
+
+    def clear(self) :
+        """Forget the created filters (the definitions are kept)."""
+        with self._lock :
+            self._filters.clear()
+
+# ------------------------------------------------------------------------------
@@ -71,12 +71,21 @@ class TrackingZone :
         self.bbox_ini = bbox
         self.bbox = bbox
         self.tracked = False
+        self.success = None
         self.algo = algo
         self.proc = TrackingProcessor(self.algo)
 
     def update(self, frame) :
         return self.proc.apply(frame, self)
 
+    def track(self, frame) :
+        """Update the tracking without drawing on the frame."""
+        return self.proc.track(frame, self)
+
+    def draw(self, frame) :
+        """Draw the last tracking result on the frame."""
+        return self.proc.draw(frame, self)
+
 # ------------------------------------------------------------------------------
 
 class TrackingProcessor(FrameProcessor) :
@@ -85,6 +94,8 @@ class TrackingProcessor(FrameProcessor) :
     context object must have same interface than TrackingZone
     """
 
+    stateful = True
+
     def __init__(self, algo) :
         self.algo = algo
         self.tracker = None
@@ -94,29 +105,52 @@ class TrackingProcessor(FrameProcessor) :
         pass
         
     def apply(self, frame, context) :
+        self.track(frame, context)
+        return self.draw(frame, context)
+
+    def track(self, frame, context) :
+        """
+        Init or update the tracking, frame is only read
+        context.success : None on init, else result of the update
+        """
 
         # init tracking on first frames
         if not context.tracked :
             self.tracker = Tracker.create(self.algo)
             context.tracked = self.tracker.init(frame, context.bbox_ini)
+            context.success = None
             logging.debug('tracking init : {} {}'.format(self.tracker, context.tracked))
-            return frame
+            return context.success
 
         # update tracking on following frames
         success, rect = self.tracker.update(frame)
         if success :
             x, y, w, h = (int(v) for v in rect)
             context.bbox = (x, y, w, h)
+        context.success = success
+
+        return context.success
+
+    def draw(self, frame, context) :
+        """
+        Draw the result of the last track() on frame
+        """
+        if context.success is None :
+            return frame
+
+        if context.success :
             cv.rectangle(frame, context.bbox, (0,255,0), 2)
         else :
             cv.rectangle(frame, context.bbox, (0,0,255), 2)
-        
+
         return frame
 
 # ------------------------------------------------------------------------------
 
 class StickingProcessor(FrameProcessor) :
 
+    stateful = True
+
     def params(self, **kwargs) :
         self.tracking = False
         self.hog = cv.HOGDescriptor()
@@ -168,6 +202,8 @@ class StickingProcessor(FrameProcessor) :
 
 class MeanShiftTrackingProcessor(FrameProcessor) :
 
+    stateful = True
+
     def params(self, **kwargs) :
         self.term_crit = (cv.TERM_CRITERIA_EPS | cv.TERM_CRITERIA_COUNT, 10, 1)
 
@@ -191,6 +227,8 @@ class MeanShiftTrackingProcessor(FrameProcessor) :
 
 class CamShiftTrackingProcessor(FrameProcessor) :
 
+    stateful = True
+
     def params(self, **kwargs) :
         self.term_crit = (cv.TERM_CRITERIA_EPS | cv.TERM_CRITERIA_COUNT, 10, 1)
 
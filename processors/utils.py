@@ -1,30 +1,304 @@
 # -*- encoding: utf-8 -*-
 
+import os
+import hashlib
+import threading
+
 import cv2
 import numpy as np
 import scipy.interpolate
+import scipy.signal
+
+
+class HistogramEngine :
+    """Several histograms of a frame computed in one pass.
+
+    Each request is a named histogram of a colour space ('gray', 'bgr'
+    or 'hsv'), the frame is converted once per space and per call.
+    step : keep one pixel out of step in both directions (nearest resize,
+           before the conversion)
+    samples : number of random pixels (fixed set for a resolution, seed)
+              the relative error of a bin holding a fraction p of the
+              pixels is about sqrt((1 - p) / (p * samples))
+    With subsampling the counts are scaled to the size of the frame.
+    """
+
+    SPACES = ('gray', 'bgr', 'hsv')
+
+    def __init__(self, step = 1, samples = None, seed = 0) :
+        self.step = step
+        self.samples = samples
+        self.seed = seed
+        self.requests = {}
+        self._buffers = BufferPool()
+        self._indices = None
+
+    def add(self, name, space, channels, histSize, ranges, sparse = False) :
+        """Request the histogram name of channels of space.
+
+        sparse : return a SparseHistogram (joint histograms with many bins)
+        """
+
+        if space not in self.SPACES :
+            raise ValueError('unknown colour space', space)
+        self.requests[name] = (space, list(channels), list(histSize),
+                               list(ranges), sparse)
+        return self
+
+    def _sample(self, image, mask) :
+        """Return the (image, mask) subsampled as configured."""
+
+        if self.samples :
+            count = image.shape[0] * image.shape[1]
+            samples = min(self.samples, count)
+            if self._indices is None or self._indices[0] != (count, samples) :
+                rng = np.random.default_rng(self.seed)
+                indices = np.sort(rng.choice(count, samples, replace = False))
+                self._indices = ((count, samples), indices)
+            indices = self._indices[1]
+
+            flat = np.ascontiguousarray(image).reshape(count, -1)
+            picked = self._buffers.get(
+                'samples', (samples, flat.shape[1]), image.dtype
+            )
+            np.take(flat, indices, axis = 0, out = picked)
+            image = picked.reshape((samples, 1) + image.shape[2:])
+            if mask is not None :
+                mask = np.take(mask.reshape(count), indices).reshape(samples, 1)
+            return image, mask
+
+        if self.step > 1 :
+            size = (
+                -(-image.shape[1] // self.step),
+                -(-image.shape[0] // self.step)
+            )
+            image = cv2.resize(
+                image, size,
+                self._buffers.get(
+                    'small', (size[1], size[0]) + image.shape[2:], image.dtype
+                ),
+                interpolation = cv2.INTER_NEAREST
+            )
+            if mask is not None :
+                mask = cv2.resize(
+                    mask, size,
+                    self._buffers.get('smallMask', (size[1], size[0]), mask.dtype),
+                    interpolation = cv2.INTER_NEAREST
+                )
+        return image, mask
+
+    def _convert(self, image, space) :
+        if space == 'gray' :
+            if isGray(image) :
+                return image
+            return cv2.cvtColor(
+                image, cv2.COLOR_BGR2GRAY,
+                self._buffers.get('gray', image.shape[:2], image.dtype)
+            )
+        if isGray(image) :
+            image = cv2.cvtColor(
+                image, cv2.COLOR_GRAY2BGR,
+                self._buffers.get('bgr', image.shape[:2] + (3,), image.dtype)
+            )
+        if space == 'bgr' :
+            return image
+        return cv2.cvtColor(
+            image, cv2.COLOR_BGR2HSV,
+            self._buffers.like('hsv', image)
+        )
+
+    def compute(self, image, names = None, mask = None) :
+        """Return { name : histogram } for names (default: every request)."""
+
+        names = list(self.requests) if names is None else names
+        sampled, mask = self._sample(image, mask)
+        scale = (image.shape[0] * image.shape[1]) / (
+            sampled.shape[0] * sampled.shape[1]
+        )
+
+        converted = {}
+        results = {}
+        for name in names :
+            space, channels, histSize, ranges, sparse = self.requests[name]
+            if space not in converted :
+                converted[space] = self._convert(sampled, space)
+            if sparse :
+                hist = SparseHistogram.fromImage(
+                    converted[space], channels, histSize, ranges, mask
+                )
+                if scale != 1 :
+                    hist.counts *= scale
+            else :
+                hist = cv2.calcHist(
+                    [converted[space]], channels, mask, histSize, ranges
+                )
+                if scale != 1 :
+                    hist *= scale
+            results[name] = hist
+
+        return results
+
+
+class SparseHistogram :
+    """Histogram keeping only its non-empty bins.
+
+    keys : sorted flat indices of the bins (C order of histSize)
+    counts : float32 counts of these bins
+    For joint colour histograms : 256x256x256 bins as a dense float32
+    array take 64 MB, a frame fills at most one bin per pixel.
+    """
+
+    # beyond this number of bins, the bins are counted by sorting
+    DENSE_COUNT_LIMIT = 1 << 20
+
+    def __init__(self, keys, counts, histSize) :
+        self.keys = np.asarray(keys, dtype = np.int64)
+        self.counts = np.asarray(counts, dtype = np.float32)
+        self.histSize = list(histSize)
+
+    @classmethod
+    def fromImage(cls, image, channels, histSize, ranges, mask = None) :
+        """Histogram of channels of an 8-bit image, like cv2.calcHist."""
+
+        image = image.reshape(image.shape[0], image.shape[1], -1)
+        size = int(np.prod(histSize))
+
+        # per channel lookup : value -> bin index * stride, -size if out of range
+        flat = np.zeros(image.shape[:2], dtype = np.int64)
+        stride = size
+        values = np.arange(256)
+        for n, channel in enumerate(channels) :
+            bins = histSize[n]
+            stride //= bins
+            low, high = ranges[2 * n], ranges[2 * n + 1]
+            index = np.floor((values - low) * bins / (high - low)).astype(np.int64)
+            lookup = np.where((index >= 0) & (index < bins), index * stride, -size)
+            flat += np.take(lookup, image[..., channel])
+
+        valid = flat >= 0
+        if mask is not None :
+            valid &= mask.reshape(valid.shape) != 0
+        flat = flat[valid]
+
+        if size <= cls.DENSE_COUNT_LIMIT :
+            counts = np.bincount(flat, minlength = size)
+            keys = np.flatnonzero(counts)
+            counts = counts[keys]
+        else :
+            keys, counts = np.unique(flat, return_counts = True)
+
+        return cls(keys, counts, histSize)
+
+    @classmethod
+    def fromDense(cls, hist) :
+        """Sparse copy of a dense histogram."""
+        flat = np.asarray(hist, dtype = np.float32).reshape(-1)
+        keys = np.flatnonzero(flat)
+        return cls(keys, flat[keys], np.shape(hist))
+
+    @property
+    def size(self) :
+        """Number of bins, empty ones included."""
+        return int(np.prod(self.histSize))
+
+    @property
+    def nbytes(self) :
+        return self.keys.nbytes + self.counts.nbytes
+
+    def __len__(self) :
+        return len(self.keys)
+
+    def __getitem__(self, index) :
+        """Count of the bin index (tuple of bin numbers)."""
+        key = np.ravel_multi_index(index, self.histSize)
+        position = np.searchsorted(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key :
+            return float(self.counts[position])
+        return 0.0
+
+    def toDense(self) :
+        """Return the float32 array given by cv2.calcHist."""
+        dense = np.zeros(self.size, dtype = np.float32)
+        dense[self.keys] = self.counts
+        return dense.reshape(self.histSize)
+
+    def _aligned(self, other) :
+        """Counts of both histograms on the union of their bins."""
+        keys = np.union1d(self.keys, other.keys)
+        first = np.zeros(len(keys), dtype = np.float64)
+        second = np.zeros(len(keys), dtype = np.float64)
+        first[np.searchsorted(keys, self.keys)] = self.counts
+        second[np.searchsorted(keys, other.keys)] = other.counts
+        return first, second
+
+    def compare(self, other, method = cv2.HISTCMP_CORREL) :
+        """Compare with another histogram, like cv2.compareHist."""
+
+        if self.histSize != other.histSize :
+            raise ValueError('histograms of different sizes',
+                             self.histSize, other.histSize)
+
+        first, second = self._aligned(other)
+        size = self.size
+
+        if method == cv2.HISTCMP_CORREL :
+            # the empty bins count in the means
+            s1, s2 = first.sum(), second.sum()
+            covariance = (first * second).sum() - s1 * s2 / size
+            variance1 = (first * first).sum() - s1 * s1 / size
+            variance2 = (second * second).sum() - s2 * s2 / size
+            denominator = np.sqrt(variance1 * variance2)
+            return float(covariance / denominator) if denominator else 1.0
+
+        if method == cv2.HISTCMP_CHISQR :
+            used = first > 0
+            return float(
+                ((first[used] - second[used]) ** 2 / first[used]).sum()
+            )
+
+        if method == cv2.HISTCMP_INTERSECT :
+            return float(np.minimum(first, second).sum())
+
+        if method == cv2.HISTCMP_BHATTACHARYYA :
+            product = first.sum() * second.sum()
+            if not product :
+                return 1.0
+            similarity = np.sqrt(first * second).sum() / np.sqrt(product)
+            return float(np.sqrt(max(1.0 - similarity, 0.0)))
+
+        raise ValueError('unsupported comparison method', method)
+
+
+def compareHistograms(first, second, method = cv2.HISTCMP_CORREL) :
+    """cv2.compareHist for dense and/or sparse histograms."""
+
+    if isinstance(first, SparseHistogram) or isinstance(second, SparseHistogram) :
+        if not isinstance(first, SparseHistogram) :
+            first = SparseHistogram.fromDense(first)
+        if not isinstance(second, SparseHistogram) :
+            second = SparseHistogram.fromDense(second)
+        return first.compare(second, method)
+
+    # flattened : on 3D histograms, cv2.compareHist (CORREL) takes the
+    # mean of the bins over a wrong number of bins
+    return cv2.compareHist(
+        np.reshape(first, (-1, 1)), np.reshape(second, (-1, 1)), method
+    )
 
 
 class Histogram1D :
 
-    def __init__(self) :
+    def __init__(self, step = 1, samples = None) :
         self.histSize = [256,]
         self.hranges = [0.0, 256.0]
         self.ranges = self.hranges
         self.channels = list(range(1))
+        self.engine = HistogramEngine(step, samples).add(
+            'gray', 'gray', self.channels, self.histSize, self.ranges
+        )
 
     def getHistogram(self, image) :
-        if isGray(image) :
-            gray = image
-        else :
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        return cv2.calcHist(
-            [gray],
-            self.channels,
-            None,
-            self.histSize,
-            self.ranges
-        )
+        return self.engine.compute(image)['gray']
 
     def getHistogramImage(self, image) :
 
@@ -49,78 +323,122 @@ class Histogram1D :
 
 
 class HistogramBGR :
+    """Joint and per channel BGR histograms.
 
-    def __init__(self) :
-        self.histSize = [256,] * 3
+    bins : bins per channel (ex: (32, 32, 32) : 128 kB instead of 64 MB
+           for the joint histogram)
+    sparse : the joint histogram is a SparseHistogram
+    """
+
+    def __init__(self, step = 1, samples = None, bins = None, sparse = False) :
+        self.histSize = list(bins or [256,] * 3)
         self.b_ranges = [0.0, 256.0]
         self.g_ranges = [0.0, 256.0]
         self.r_ranges = [0.0, 256.0]
         self.ranges = self.b_ranges + self.g_ranges + self.r_ranges
         self.channels = list(range(3))
+        self.engine = HistogramEngine(step, samples).add(
+            'bgr', 'bgr', self.channels, self.histSize, self.ranges, sparse
+        )
+        for channel, name in enumerate('bgr') :
+            self.engine.add(
+                name, 'bgr', [channel], self.histSize[channel:channel + 1],
+                self.ranges[2 * channel:2 * channel + 2]
+            )
 
     def getHistogram(self, image) :
-        return cv2.calcHist(
-            [image],
-            self.channels,
-            None,
-            self.histSize,
-            self.ranges
-        )
+        return self.engine.compute(image, ['bgr'])['bgr']
+
+    def getHistograms(self, image) :
+        """Return the b, g and r histograms, in one pass."""
+        return self.engine.compute(image, ['b', 'g', 'r'])
+
+    def compare(self, first, second, method = cv2.HISTCMP_CORREL) :
+        return compareHistograms(first, second, method)
         
 
 class HistogramHSV :
+    """Joint, HS and per channel HSV histograms.
 
-    def __init__(self) :
-        self.histSize = [180, 256, 256]
+    bins : bins per channel (ex: (30, 32, 32) : 120 kB instead of 47 MB
+           for the joint histogram)
+    sparse : the joint histogram is a SparseHistogram
+    """
+
+    def __init__(self, step = 1, samples = None, bins = None, sparse = False) :
+        self.histSize = list(bins or [180, 256, 256])
         self.hranges = [0.0, 180.0]
         self.sranges = [0.0, 256.0]
         self.vranges = [0.0, 256.0]
         self.ranges = self.hranges + self.sranges + self.vranges
         self.channels = list(range(3))
+        self.engine = HistogramEngine(step, samples)
+        self.engine.add('hsv', 'hsv', self.channels, self.histSize,
+                        self.ranges, sparse)
+        self.engine.add('hs', 'hsv', self.channels[:2], self.histSize[:2],
+                        self.ranges[:4])
+        self.engine.add('h', 'hsv', self.channels[:1], self.histSize[:1],
+                        self.ranges[:2])
+        self.engine.add('s', 'hsv', self.channels[1:2], self.histSize[1:2],
+                        self.ranges[2:4])
+        self.engine.add('v', 'hsv', self.channels[2:], self.histSize[2:],
+                        self.ranges[4:])
+
+    def getHistograms(self, image, names = ('h', 's', 'v', 'hs')) :
+        """Return { name : histogram } of h, s, v and hs, with one
+        conversion to HSV.
+        """
+        return self.engine.compute(image, list(names))
+
+    def getHistogram(self, image) :
+        return self.engine.compute(image, ['hsv'])['hsv']
+
+    def compare(self, first, second, method = cv2.HISTCMP_CORREL) :
+        return compareHistograms(first, second, method)
 
     def getHistogramHS(self, image) :
-        hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-
-        return cv2.calcHist(
-            [hsv_image],
-            self.channels[:2],
-            None,
-            self.histSize[:2],
-            self.ranges[:4]
-        )
+        return self.engine.compute(image, ['hs'])['hs']
 
     def getHistogramH(self, image) :
-        hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-
-        return cv2.calcHist(
-            [hsv_image],
-            self.channels[:1],
-            None,
-            self.histSize[:1],
-            self.ranges[:2]
-        )
+        return self.engine.compute(image, ['h'])['h']
 
     def getHistogramS(self, image) :
-        hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-
-        return cv2.calcHist(
-            [hsv_image],
-            self.channels[1:2],
-            None,
-            self.histSize[1:2],
-            self.ranges[2:4]
-        )
+        return self.engine.compute(image, ['s'])['s']
         
     def getHistogramV(self, image) :
-        hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-
-        return cv2.calcHist(
-            [hsv_image],
-            self.channels[2:],
-            None,
-            self.histSize[2:],
-            self.ranges[4:]
-        )
+        return self.engine.compute(image, ['v'])['v']
+
+
+class BufferPool :
+    """Named scratch arrays kept between calls.
+
+    A buffer is reallocated only when the requested shape or dtype changes.
+    """
+
+    def __init__(self) :
+        self._buffers = {}
+
+    def get(self, name, shape, dtype = np.uint8) :
+        """Return the buffer called name, with the given shape and dtype."""
+
+        shape = tuple(shape)
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype :
+            buffer = np.empty(shape, dtype)
+            self._buffers[name] = buffer
+        return buffer
+
+    def like(self, name, array) :
+        """Return the buffer called name, shaped like array."""
+
+        return self.get(name, array.shape, array.dtype)
+
+    def clear(self) :
+        self._buffers.clear()
+
+    @property
+    def nbytes(self) :
+        return sum(buffer.nbytes for buffer in self._buffers.values())
 
 
 def createCurveFunc(points):
@@ -144,25 +462,243 @@ def createCurveFunc(points):
     return scipy.interpolate.interp1d(xs, ys, kind,
                                       bounds_error = False)
 
-def createLookupArray(func, length = 256):
+def scaleCurvePoints(points, length, pointsRange = 256):
+    """Return control points in [0, pointsRange - 1] scaled to
+    [0, length - 1] (ex: 8-bit curves applied to 16-bit images).
+    """
+
+    if points is None or length == pointsRange:
+        return points
+
+    scale = (length - 1) / (pointsRange - 1.0)
+    return [(x * scale, y * scale) for x, y in points]
+
+
+def lookupLength(dtype = np.uint8, bits = None):
+    """Return the number of entries of a lookup table for dtype.
+
+    bits : significant bits of the samples, when less than the dtype holds
+           (ex: 12-bit camera data in np.uint16)
+    """
+
+    if bits is None:
+        bits = np.iinfo(dtype).bits
+    return 1 << bits
+
+
+def createLookupArray(func, length = 256, dtype = None):
     """Return a lookup for whole-number inputs to a function.
 
     The lookup values are clamped to [0, length - 1].
+    The lookup is float64, or dtype (truncated) when given.
     """
 
     if func is None:
         return None
 
-    lookupArray = np.empty(length)
-    i = 0
-    while i < length:
-        func_i = func(i)
-        lookupArray[i] = min(max(0, func_i), length - 1)
-        i += 1
+    # the curve functions accept arrays : one call for the whole table
+    lookupArray = np.asarray(func(np.arange(length)), dtype = np.float64)
+    lookupArray = np.broadcast_to(lookupArray, (length,)).copy()
+    np.nan_to_num(lookupArray, copy = False, nan = 0)
+    np.clip(lookupArray, 0, length - 1, out = lookupArray)
 
+    if dtype is not None:
+        return lookupArray.astype(dtype)
     return lookupArray
 
 
+def createLookupTable(funcs, length = 256, dtype = np.uint8):
+    """Return a (length, 1, channels) lookup table in dtype.
+
+    funcs has one function per channel, None leaves the channel unchanged.
+    The table is usable by cv2.LUT for 8-bit images.
+    """
+
+    table = np.empty((length, 1, len(funcs)), dtype = dtype)
+    for channel, func in enumerate(funcs):
+        lookupArray = createLookupArray(func, length, dtype)
+        if lookupArray is None:
+            table[:, 0, channel] = np.arange(length, dtype = dtype)
+        else:
+            table[:, 0, channel] = lookupArray
+
+    return table
+
+
+class LookupTableCache :
+    """Lookup tables kept by key (ex: control points, length and dtype).
+
+    With a directory, the tables are also saved as .npy files, so that
+    they are built once across runs. The cached tables are read-only.
+    Change version when the way the tables are built changes.
+    """
+
+    version = 1
+
+    def __init__(self, directory = None) :
+        self.directory = directory
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def _filename(self, key) :
+        digest = hashlib.sha1(
+            repr((self.version, key)).encode('utf-8')
+        ).hexdigest()
+        return os.path.join(self.directory, digest + '.npy')
+
+    def get(self, key, build) :
+        """Return the table of key, built by build() when not cached."""
+
+        with self._lock :
+            table = self._tables.get(key)
+        if table is not None :
+            return table
+
+        table = None
+        if self.directory :
+            try :
+                table = np.load(self._filename(key))
+            except (OSError, ValueError) :
+                table = None
+
+        if table is None :
+            table = build()
+            if self.directory and table is not None :
+                self._save(key, table)
+
+        if table is not None :
+            table.flags.writeable = False
+        with self._lock :
+            return self._tables.setdefault(key, table)
+
+    def _save(self, key, table) :
+        os.makedirs(self.directory, exist_ok = True)
+        filename = self._filename(key)
+        # write then rename : no partial file for the other processes
+        temp = '{}.{}.tmp'.format(filename, os.getpid())
+        try :
+            with open(temp, 'wb') as f :
+                np.save(f, table)
+            os.replace(temp, filename)
+        except OSError :
+            # the cache is an optimization : a read-only directory is fine
+            if os.path.exists(temp) :
+                os.remove(temp)
+
+    def clear(self) :
+        """Forget the tables in memory (the files are kept)."""
+        with self._lock :
+            self._tables.clear()
+
+
+def composeLookupTables(first, second):
+    """Return the table applying first, then second.
+
+    None is the identity. A one channel table is applied to every channel.
+    """
+
+    if first is None:
+        return second
+    if second is None:
+        return first
+
+    channels = max(first.shape[2], second.shape[2])
+    first = np.broadcast_to(first, first.shape[:2] + (channels,))
+    second = np.broadcast_to(second, second.shape[:2] + (channels,))
+
+    table = np.empty(first.shape, dtype = second.dtype)
+    for channel in range(channels):
+        table[:, 0, channel] = second[first[:, 0, channel], 0, channel]
+
+    return table
+
+
+def isSmoothingKernel(kernel):
+    """Return True if the kernel weights are non-negative and sum to <= 1.
+
+    The result of such a convolution never saturates.
+    """
+
+    kernel = np.asarray(kernel)
+    return bool(kernel.min() >= 0 and kernel.sum() <= 1 + 1e-6)
+
+
+def isUniformKernel(kernel):
+    """Return True if every weight of the kernel is the same."""
+
+    kernel = np.asarray(kernel)
+    return bool(np.all(kernel == kernel.flat[0]))
+
+
+def separateKernel(kernel, tolerance = 1e-6):
+    """Return (kernelX, kernelY) if the kernel is separable, else None.
+
+    The kernel is separable when its rank is 1 :
+    kernel == np.outer(kernelY, kernelX)
+    """
+
+    kernel = np.asarray(kernel, dtype = np.float64)
+    if kernel.ndim != 2 or min(kernel.shape) < 2:
+        return None
+
+    u, s, vt = np.linalg.svd(kernel)
+    if s[0] == 0 or s[1] > tolerance * s[0]:
+        return None
+
+    root = np.sqrt(s[0])
+    kernelX = (root * vt[0]).reshape(1, -1)
+    kernelY = (root * u[:, 0]).reshape(-1, 1)
+    return kernelX, kernelY
+
+
+def composeKernels(first, second):
+    """Return the kernel correlating like first, then second (cv2.filter2D)."""
+
+    return scipy.signal.convolve2d(
+        np.asarray(first, dtype = np.float64),
+        np.asarray(second, dtype = np.float64)
+    )
+
+
+def applyLookupTable(table, src, dst, buffers = None):
+    """Map a source to a destination using a lookup table.
+
+    The table has one channel, or as many channels as the source.
+    Samples beyond the table (ex: 16-bit data, 12-bit table) get its
+    last entry.
+    buffers : BufferPool for the channel planes of 16-bit BGR images
+    """
+
+    if table is None:
+        if dst is not src:
+            dst[...] = src
+        return
+
+    if src.dtype == np.uint8 and len(table) == 256:
+        cv2.LUT(src, table, dst)
+    elif table.shape[2] == 1 or isGray(src):
+        # cv2.LUT is limited to 8-bit sources
+        np.take(table[:, 0, 0], src, out = dst, mode = 'clip')
+    else:
+        # np.take is much faster on contiguous planes
+        # than on the strided channels of an interleaved image
+        if buffers is None:
+            buffers = BufferPool()
+        planes = [
+            buffers.get('plane%d' % channel, src.shape[:2], src.dtype)
+            for channel in range(src.shape[2])
+        ]
+        mapped = [
+            buffers.get('mapped%d' % channel, src.shape[:2], table.dtype)
+            for channel in range(src.shape[2])
+        ]
+        cv2.split(src, planes)
+        for channel in range(src.shape[2]):
+            np.take(table[:, 0, channel], planes[channel],
+                    out = mapped[channel], mode = 'clip')
+        cv2.merge(mapped, dst)
+
+
 def applyLookupArray(lookupArray, src, dst):
     """Map a source to a destination using a lookup."""
 
@@ -197,6 +733,56 @@ def isGray(image):
     return image.ndim < 3
 
 
+def scaleKsize(ksize, scale):
+    """Return an odd kernel size scaled by scale, at least 1."""
+
+    ksize = int(round(ksize * scale))
+    return max(1, ksize | 1)
+
+
+def clipRect(rect, shape):
+    """Return the (x, y, w, h) rect clipped to an image shape, or None."""
+
+    x, y, w, h = (int(v) for v in rect)
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(shape[1], x + w), min(shape[0], y + h)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def maskRects(mask):
+    """Return the bounding rects of the regions of a binary mask."""
+
+    contours, _ = cv2.findContours(
+        (mask > 0).astype(np.uint8),
+        cv2.RETR_EXTERNAL,
+        cv2.CHAIN_APPROX_SIMPLE
+    )
+    return [cv2.boundingRect(contour) for contour in contours]
+
+
+def regionViews(rects, mask, *images):
+    """Yield, for each region, the views of the images (and of the mask).
+
+    The regions are the rects, or the bounding rects of the mask.
+    The views share the memory of the images : no copy.
+    """
+
+    shape = images[0].shape
+    if rects is None:
+        rects = maskRects(mask) if mask is not None else [(0, 0, shape[1], shape[0])]
+
+    for rect in rects:
+        rect = clipRect(rect, shape)
+        if rect is None:
+            continue
+        x, y, w, h = rect
+        views = tuple(image[y:y+h, x:x+w] for image in images)
+        roiMask = None if mask is None else mask[y:y+h, x:x+w]
+        yield rect, views, roiMask
+
+
 def widthHeightDividedBy(image, divisor):
     """Return an image's dimensions, divided by a value."""
 
@@ -14,6 +14,8 @@ from processors.pedestrian import PedestrianProcessor
 from processors.lines import LinesProcessor
 from processors.circles import CirclesProcessor
 from processors.backsubtractors import BackSubProcessor
+from processors.chain import ProcessorChain
+from processors.gating import StaticSceneProcessor
 
 # ------------------------------------------------------------------------------
 
@@ -65,6 +67,9 @@ class Application(tkinter.Tk) :
         backsub_btn = tkinter.Button(self, text='Background Suppression', command=self.cmd_backsub)
         backsub_btn.pack(fill=tkinter.BOTH)
 
+        backsub_circles_btn = tkinter.Button(self, text='Background + Circles', command=self.cmd_backsub_circles)
+        backsub_circles_btn.pack(fill=tkinter.BOTH)
+
     def cmd_run(self, processor=None, zone=None) :
         self.camera.reset_counter()
         source = self.source.get()
@@ -101,22 +106,23 @@ class Application(tkinter.Tk) :
         )
 
     def cmd_pedestrian(self, event=None) :
+        # the detectors run again only when the scene changes
         self.cmd_run(
-            processor = PedestrianProcessor()
+            processor = StaticSceneProcessor(PedestrianProcessor())
         )
         
     def cmd_lines(self, event=None) :
         processor = LinesProcessor()
         processor.params(minLineLength=60, maxLineGap=3)
         self.cmd_run(
-            processor = processor
+            processor = StaticSceneProcessor(processor)
         )
         
     def cmd_circles(self, event=None) :
         processor = CirclesProcessor()
         processor.params(minRadius=5, maxRadius=40)
         self.cmd_run(
-            processor = processor
+            processor = StaticSceneProcessor(processor)
         )
 
     def cmd_backsub(self, event=None) :
@@ -124,6 +130,17 @@ class Application(tkinter.Tk) :
             processor = BackSubProcessor()
         )
 
+    def cmd_backsub_circles(self, event=None) :
+        circles = CirclesProcessor()
+        circles.params(minRadius=5, maxRadius=40)
+        self.cmd_run(
+            processor = ProcessorChain([
+                BackSubProcessor(),
+                circles,
+                FramecountProcessor(),
+            ])
+        )
+
     def cmd_close(self) :
         self.camera.release()
         self.destroy()
@@ -50,7 +50,7 @@ class Application :
 
     def cancel(self) :
         self.root.destroy()
-        self.vidcap.release()
+        self.capman.release()
 
     def take_snapshot(self) :
         """ Take snapshot and save to file """
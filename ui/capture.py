@@ -1,22 +1,259 @@
 # -*- encoding: utf8 -*-
 
 import sys
+import collections
+import threading
 import cv2 as cv
 import numpy as np
 import time
 
-__all__ = [ 'CaptureManager', 'CameraCapture' ]
+from ui.timing import StageTimer
+
+__all__ = [ 'FrameGrabber', 'AsyncVideoWriter', 'CaptureManager', 'CameraCapture' ]
+
+# ------------------------------------------------------------------------------
+
+GRAB_LATEST = 'latest'
+GRAB_EVERY = 'every'
+
+WRITE_BLOCK = 'block'
+WRITE_DROP_OLDEST = 'drop-oldest'
+WRITE_DROP_NEWEST = 'drop-newest'
+
+# ------------------------------------------------------------------------------
+
+class FrameGrabber(threading.Thread) :
+    """
+    Grab and decode frames from a camera into a ring of preallocated buffers.
+    policy GRAB_LATEST : the consumer always gets the newest frame,
+                         unread older frames are recycled (and counted dropped)
+    policy GRAB_EVERY : the consumer gets every frame in order,
+                        the grabber waits when the ring is full
+    """
+
+    def __init__(self, camera, size=4, policy=GRAB_LATEST) :
+
+        # init threading.Thread
+        super().__init__(name='FrameGrabberThread', daemon=True)
+
+        if policy not in (GRAB_LATEST, GRAB_EVERY) :
+            raise ValueError('unknown grab policy', policy)
+
+        self.camera = camera
+        self.size = max(2, size)
+        self.policy = policy
+
+        # ring of buffers, allocated when the grabber starts
+        self._ring = [None] * self.size
+        self._free = collections.deque(range(self.size))
+        self._filled = collections.deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._finished = False
+
+        self.framesGrabbed = 0
+        self.framesDropped = 0
+
+    @property
+    def isFinished(self) :
+        return self._finished
+
+    def stop(self) :
+        """Ask the grabber to stop, then wait for it."""
+        with self._cond :
+            self._stopped = True
+            self._cond.notify_all()
+        if self.is_alive() and self is not threading.current_thread() :
+            self.join()
+
+    def _allocateRing(self) :
+        w = int(self.camera.get(cv.CAP_PROP_FRAME_WIDTH))
+        h = int(self.camera.get(cv.CAP_PROP_FRAME_HEIGHT))
+        if w > 0 and h > 0 :
+            self._ring = [
+                np.empty((h, w, 3), dtype=np.uint8)
+                for _ in range(self.size)
+            ]
+
+    def run(self) :
+        self._allocateRing()
+        try :
+            while True :
+                index = self._acquireSlot()
+                if index is None :
+                    break
+
+                # decode outside the lock, into the preallocated slot
+                ok, image = self.camera.read(self._ring[index])
+
+                with self._cond :
+                    if not ok or image is None :
+                        self._free.append(index)
+                        break
+                    # the slot is reallocated if the frame size changed
+                    self._ring[index] = image
+                    self._filled.append(index)
+                    self.framesGrabbed += 1
+                    self._cond.notify_all()
+        finally :
+            with self._cond :
+                self._finished = True
+                self._cond.notify_all()
+
+    def _acquireSlot(self) :
+        with self._cond :
+            while not self._stopped :
+                if self._free :
+                    return self._free.popleft()
+                if self.policy == GRAB_LATEST and self._filled :
+                    # recycle the oldest unread frame
+                    self.framesDropped += 1
+                    return self._filled.popleft()
+                self._cond.wait()
+        return None
+
+    def acquire(self, timeout=None) :
+        """
+        Return (index, frame) of the next frame for the consumer,
+        or (None, None) when no more frames are available.
+        The slot belongs to the consumer until release(index).
+        """
+        with self._cond :
+            while not self._filled :
+                if self._finished or self._stopped :
+                    return None, None
+                if not self._cond.wait(timeout) :
+                    return None, None
+
+            if self.policy == GRAB_LATEST :
+                # keep the newest, give back the older ones
+                while len(self._filled) > 1 :
+                    self._free.append(self._filled.popleft())
+                    self.framesDropped += 1
+                self._cond.notify_all()
+
+            index = self._filled.popleft()
+            return index, self._ring[index]
+
+    def release(self, index) :
+        """Give back a slot obtained by acquire()."""
+        with self._cond :
+            self._free.append(index)
+            self._cond.notify_all()
+
+# ------------------------------------------------------------------------------
+
+class AsyncVideoWriter(threading.Thread) :
+    """
+    Encode frames with a cv.VideoWriter in a background thread.
+    Frames are copied into a bounded queue of preallocated buffers.
+    policy when the queue is full :
+    WRITE_BLOCK : write() waits for the encoder
+    WRITE_DROP_OLDEST : the oldest queued frame is dropped
+    WRITE_DROP_NEWEST : the new frame is dropped
+    """
+
+    def __init__(self, writer, size=32, policy=WRITE_BLOCK) :
+
+        # init threading.Thread
+        super().__init__(name='VideoWriterThread', daemon=True)
+
+        if policy not in (WRITE_BLOCK, WRITE_DROP_OLDEST, WRITE_DROP_NEWEST) :
+            raise ValueError('unknown write policy', policy)
+
+        self.writer = writer
+        self.size = max(1, size)
+        self.policy = policy
+
+        self._buffers = []
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.framesWritten = 0
+        self.framesDropped = 0
+
+        self.start()
+
+    def _buffer(self, frame) :
+        """A buffer shaped like frame, recycled from the encoded ones"""
+        while self._buffers :
+            buffer = self._buffers.pop()
+            if buffer.shape == frame.shape and buffer.dtype == frame.dtype :
+                return buffer
+        return np.empty_like(frame)
+
+    def write(self, frame) :
+        with self._cond :
+            if self._closed :
+                return
+
+            if len(self._queue) >= self.size :
+                if self.policy == WRITE_DROP_NEWEST :
+                    self.framesDropped += 1
+                    return
+                if self.policy == WRITE_DROP_OLDEST :
+                    self._buffers.append(self._queue.popleft())
+                    self.framesDropped += 1
+                else :
+                    while len(self._queue) >= self.size :
+                        self._cond.wait()
+
+            buffer = self._buffer(frame)
+            np.copyto(buffer, frame)
+            self._queue.append(buffer)
+            self._cond.notify_all()
+
+    def run(self) :
+        while True :
+            with self._cond :
+                while not self._queue and not self._closed :
+                    self._cond.wait()
+                if not self._queue :
+                    break
+                buffer = self._queue.popleft()
+
+            # encode outside the lock
+            self.writer.write(buffer)
+
+            with self._cond :
+                self.framesWritten += 1
+                self._buffers.append(buffer)
+                self._cond.notify_all()
+
+    def release(self) :
+        """Flush the queued frames, then release the writer."""
+        with self._cond :
+            self._closed = True
+            self._cond.notify_all()
+        self.join()
+        self.writer.release()
 
 # ------------------------------------------------------------------------------
 
 class CaptureManager :
 
     def __init__(self, camera, previewWindowManager = None,
-                 shouldMirrorPreview = False) :
+                 shouldMirrorPreview = False, threaded = False,
+                 bufferSize = 4, grabPolicy = GRAB_LATEST) :
 
         self.previewWindowManager = previewWindowManager
         self.shouldMirrorPreview = shouldMirrorPreview
 
+        # threaded mode : a FrameGrabber decodes into a ring of buffers
+        self.threaded = threaded
+        self.bufferSize = bufferSize
+        self.grabPolicy = grabPolicy
+        self._grabber = None
+        self._slot = None
+
+        # background encoding of the video frames
+        self.videoFramesDropped = 0
+
+        # reusable buffers : retrieved frame and mirrored preview
+        self._frameBuffer = None
+        self._mirrorBuffer = None
+
         self._camera = camera
         self._channel = 0
         self._enteredFrame = False
@@ -25,10 +262,15 @@ class CaptureManager :
         self._videoFilename = None
         self._videoEncoding = None
         self._videoWriter = None
+        self._videoAsync = None
 
         self.framesElapsed = 0
         self.fpsEstimate = 0
 
+        # rolling latency of grab, retrieve, display and write stages,
+        # the application may add its own (process, overlay, ...)
+        self.timings = StageTimer()
+
     @property
     def camera(self) :
         return self._camera
@@ -66,10 +308,29 @@ class CaptureManager :
             self._channel = value
             self._frame = None
 
+    @property
+    def framesDropped(self) :
+        if self._grabber is None :
+            return 0
+        return self._grabber.framesDropped
+
+    @property
+    def frameBuffer(self) :
+        return self._frameBuffer
+
+    @frameBuffer.setter
+    def frameBuffer(self, buffer) :
+        """Caller-owned array where the next frames are retrieved."""
+        self._frameBuffer = buffer
+
     @property
     def frame(self) :
-        if self._enteredFrame and self._frame is None :
-            _, self._frame = self._camera.retrieve()
+        if self._enteredFrame and self._frame is None and not self.threaded :
+            with self.timings.stage('retrieve') :
+                _, self._frame = self._camera.retrieve(self._frameBuffer)
+            # keep the (possibly reallocated) array for the next frames
+            if self._frame is not None :
+                self._frameBuffer = self._frame
         return self._frame
 
     @property
@@ -90,8 +351,57 @@ class CaptureManager :
         # prepare to evaluate fps
         self.ticks_start = cv.getTickCount()
 
+        if self._camera is None :
+            return
+
+        if self.threaded :
+            if self._grabber is None :
+                self.startGrabbing()
+            # time spent waiting for the grabber thread
+            with self.timings.stage('grab') :
+                self._slot, self._frame = self._grabber.acquire()
+            self._enteredFrame = self._slot is not None
+            self.timings.dropped = self._grabber.framesDropped
+        else :
+            with self.timings.stage('grab') :
+                self._enteredFrame = self._camera.grab()
+            # a file is read at our pace, a camera goes on without us
+            if self._camera.get(cv.CAP_PROP_FRAME_COUNT) <= 0 :
+                self.timings.frame(self._camera.get(cv.CAP_PROP_FPS))
+
+    def startGrabbing(self) :
+        """Start the background grabber thread (threaded mode)."""
+        if self._grabber is None :
+            self._grabber = FrameGrabber(
+                self._camera,
+                self.bufferSize,
+                self.grabPolicy
+            )
+            self._grabber.start()
+
+    def stopGrabbing(self) :
+        """Stop the background grabber thread, if any."""
+        if self._grabber is not None :
+            self._grabber.stop()
+            self._grabber = None
+            self._slot = None
+
+    def release(self) :
+        """
+        Finish the video file (the queued frames are encoded), stop the
+        grabber thread, if any, then release the camera.
+        """
+        self.stopWritingVideo()
+        self.stopGrabbing()
         if self._camera is not None :
-            self._enteredFrame = self._camera.grab()
+            self._camera.release()
+
+    def _releaseFrame(self) :
+        if self._slot is not None :
+            self._grabber.release(self._slot)
+            self._slot = None
+        self._frame = None
+        self._enteredFrame = False
 
     def exitFrame(self) :
         """Draw to the window. Write to file. Release the frame."""
@@ -99,22 +409,28 @@ class CaptureManager :
         # Check whether any grabbed frame is retreivable.
         # The getter may retreive and cache the frame.
         if self.frame is None :
-            self._enteredFrame = False
+            self._releaseFrame()
             return
 
         # Draw to the window, if any
         if self.previewWindowManager is not None :
+            self.timings.start('display')
             if self.shouldMirrorPreview :
-                mirroredFrame = np.fliplr(self._frame).copy()
-                self.previewWindowManager.show(mirroredFrame)
+                self._mirrorBuffer = cv.flip(self._frame, 1, self._mirrorBuffer)
+                self.previewWindowManager.show(self._mirrorBuffer)
             else :
                 self.previewWindowManager.show(self._frame)
             self.previewWindowManager.processEvents()
+            self.timings.stop('display')
 
         # Update the FPS estimate and related variables.
         self.framesElapsed += 1
         self.fpsEstimate = cv.getTickFrequency() / (cv.getTickCount() - self.ticks_start)
 
+        writing = self.isWritingImage or self.isWritingVideo
+        if writing :
+            self.timings.start('write')
+
         # Write to the image file, if any.
         if self.isWritingImage :
             cv.imwrite(self._imageFilename, self._frame)
@@ -123,21 +439,36 @@ class CaptureManager :
         # Write to the video file, if any.
         self._writeVideoFrame()
 
+        if writing :
+            self.timings.stop('write')
+
         # Release the frame.
-        self._frame = None
-        self._enteredFrame = False
+        self._releaseFrame()
         
     def writeImage(self, filename) :
         """Write the next exited frame to an image file."""
         self._imageFilename = filename
 
-    def startWritingVideo(self, filename, encoding='I420') :
-        """Start writing exited frames to a video file."""
+    def startWritingVideo(self, filename, encoding='I420',
+                          asynchronous=False, queueSize=32,
+                          queuePolicy=WRITE_BLOCK) :
+        """Start writing exited frames to a video file.
+
+        asynchronous : encode in a background thread through a bounded
+        queue of queueSize frames, queuePolicy applies when it is full.
+        """
         self._videoFilename = filename
         self._videoEncoding = cv.VideoWriter_fourcc(*encoding)
+        self._videoAsync = (queueSize, queuePolicy) if asynchronous else None
+        self.videoFramesDropped = 0
 
     def stopWritingVideo(self) :
         """Stop writing exited frames to a video file."""
+        if self._videoWriter is not None :
+            # flush the queued frames, if any
+            self._videoWriter.release()
+            if isinstance(self._videoWriter, AsyncVideoWriter) :
+                self.videoFramesDropped = self._videoWriter.framesDropped
         self._videoFilename = None
         self._videoEncoding = None
         self._videoWriter = None
@@ -170,7 +501,18 @@ class CaptureManager :
                 size
             )
 
+            if self._videoAsync is not None :
+                queueSize, queuePolicy = self._videoAsync
+                self._videoWriter = AsyncVideoWriter(
+                    self._videoWriter,
+                    queueSize,
+                    queuePolicy
+                )
+
         self._videoWriter.write(self._frame)
+
+        if isinstance(self._videoWriter, AsyncVideoWriter) :
+            self.videoFramesDropped = self._videoWriter.framesDropped
     
 # ------------------------------------------------------------------------------
 
@@ -218,6 +560,9 @@ class CameraCapture(object) :
             self.camera.release()
             cv.destroyWindow(self.windowName)
             self.camera = None
+        # stop the worker processes of a pooled processor
+        if hasattr(self.processor, 'close') :
+            self.processor.close()
 
     def reset_counter(self) :
         self.frameno = 0
@@ -258,8 +603,9 @@ class CameraCapture(object) :
             self.frameno += 1
             frame = self.process_frame(frame)
 
-            # show frame
-            cv.imshow(self.windowName, frame)
+            # show frame (a pipelined processor may have no result yet)
+            if frame is not None :
+                cv.imshow(self.windowName, frame)
 
             # update master ?
             if self.master :
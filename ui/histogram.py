@@ -0,0 +1,127 @@
+# -*- encoding: utf-8 -*-
+
+import cv2 as cv
+import numpy as np
+
+from processors import utils
+
+__all__ = [ 'HistogramView' ]
+
+# --------------------------------------------------------------------
+
+HIST_GRAY = 'gray'
+HIST_BGR = 'bgr'
+HIST_HS = 'hs'
+
+# --------------------------------------------------------------------
+
+class HistogramView :
+    """
+    Live histogram of the frames, drawn on a canvas kept between frames
+    mode : HIST_GRAY (filled curve), HIST_BGR (one curve per channel)
+           or HIST_HS (hue x saturation heatmap)
+    interval : the histogram is computed every interval frames, the
+               canvas is drawn as is in between
+    step : pixel subsampling of the histogram (see utils.HistogramEngine)
+
+    view.draw(frame) overlays the canvas on the preview (WindowManager),
+    view.update(frame) returns the canvas (BGR) for another widget (Tk).
+    """
+
+    def __init__(self, mode=HIST_GRAY, size=(256, 128), interval=5,
+                 step=4, hsBins=(30, 32)) :
+        if mode not in (HIST_GRAY, HIST_BGR, HIST_HS) :
+            raise ValueError('unknown histogram mode', mode)
+
+        self.mode = mode
+        self.size = size
+        self.interval = interval
+        self.frames = 0
+
+        width, height = size
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self._buffers = utils.BufferPool()
+
+        self.engine = utils.HistogramEngine(step)
+        if mode == HIST_GRAY :
+            self.engine.add('gray', 'gray', [0], [256], [0, 256])
+        elif mode == HIST_BGR :
+            for channel, name in enumerate('bgr') :
+                self.engine.add(name, 'bgr', [channel], [256], [0, 256])
+        else :
+            self.engine.add('hs', 'hsv', [0, 1], list(hsBins), [0, 180, 0, 256])
+
+        # curves : one point per bin, then the bottom corners (filling)
+        self._points = np.empty((256 + 2, 2), dtype=np.int32)
+        self._points[:256, 0] = np.linspace(0, width - 1, 256)
+        self._points[256] = (width - 1, height - 1)
+        self._points[257] = (0, height - 1)
+        self._heights = np.empty((256, 1), dtype=np.float32)
+
+        # heatmap : fixed hue and saturation, value from the histogram
+        self._hsv = np.empty(tuple(hsBins) + (3,), dtype=np.uint8)
+        self._hsv[..., 0] = (np.arange(hsBins[0]) * 180 // hsBins[0])[:, np.newaxis]
+        self._hsv[..., 1] = (np.arange(hsBins[1]) * 256 // hsBins[1])[np.newaxis, :]
+        self._heatmap = np.empty_like(self._hsv)
+
+    def _curve(self, hist) :
+        """Points of the curve of hist, updated in place"""
+        height = self.size[1]
+        cv.normalize(hist, self._heights, 0.9 * (height - 1), 0, cv.NORM_INF)
+        np.subtract(height - 1, self._heights[:, 0],
+                    out=self._points[:256, 1], casting='unsafe')
+        return self._points
+
+    def _render(self, hists) :
+        canvas = self.canvas
+        canvas[...] = 32
+
+        if self.mode == HIST_GRAY :
+            points = self._curve(hists['gray'])
+            cv.fillPoly(canvas, [points], (128, 128, 128))
+            cv.polylines(canvas, [points[:256]], False, (255, 255, 255))
+        elif self.mode == HIST_BGR :
+            for name, color in zip('bgr', ((255, 0, 0), (0, 255, 0), (0, 0, 255))) :
+                points = self._curve(hists[name])
+                cv.polylines(canvas, [points[:256]], False, color)
+        else :
+            value = self._hsv[..., 2]
+            # square root : the few dominant colours do not hide the others
+            hist = cv.sqrt(hists['hs'])
+            cv.normalize(hist, hist, 255, 0, cv.NORM_INF)
+            np.copyto(value, hist, casting='unsafe')
+            cv.cvtColor(self._hsv, cv.COLOR_HSV2BGR, self._heatmap)
+            cv.resize(self._heatmap, self.size, canvas,
+                      interpolation=cv.INTER_NEAREST)
+
+    def update(self, frame) :
+        """Compute the histogram of frame when due, return the canvas."""
+        if self.frames % self.interval == 0 :
+            self._render(self.engine.compute(frame))
+        self.frames += 1
+        return self.canvas
+
+    def draw(self, frame, org=(10, 10), alpha=0.75) :
+        """
+        Update with frame then blend the canvas on frame at org.
+        org is kept inside the frame, the canvas is cropped to the frame.
+        """
+        self.update(frame)
+
+        x, y = max(0, org[0]), max(0, org[1])
+        h = min(self.size[1], frame.shape[0] - y)
+        w = min(self.size[0], frame.shape[1] - x)
+        if h <= 0 or w <= 0 :
+            return frame
+
+        canvas = self.canvas[:h, :w]
+        if utils.isGray(frame) :
+            canvas = cv.cvtColor(
+                canvas, cv.COLOR_BGR2GRAY,
+                self._buffers.get('gray', (h, w))
+            )
+        roi = frame[y:y + h, x:x + w]
+        cv.addWeighted(canvas, alpha, roi, 1.0 - alpha, 0, roi)
+        return frame
+
+# --------------------------------------------------------------------
@@ -0,0 +1,132 @@
+# -*- encoding: utf-8 -*-
+
+import collections
+import contextlib
+
+import cv2 as cv
+import numpy as np
+
+__all__ = [ 'StageTimer' ]
+
+# --------------------------------------------------------------------
+
+class StageTimer :
+    """
+    Rolling latency statistics for the stages of a frame loop
+    (grab, retrieve, process, overlay, display, write, ...)
+
+    with timer.stage('process') :
+        ...
+    timer.stats()['process']['p95']
+    """
+
+    def __init__(self, window=120) :
+        self.window = window
+        self._samples = collections.OrderedDict()
+        self._starts = {}
+        self._freq = 1000.0 / cv.getTickFrequency()
+        self._lastFrame = None
+        self.dropped = 0
+
+    def reset(self) :
+        self._samples.clear()
+        self._starts.clear()
+        self._lastFrame = None
+        self.dropped = 0
+
+    def start(self, name) :
+        self._starts[name] = cv.getTickCount()
+
+    def stop(self, name) :
+        """Record the time elapsed since start(name), in ms."""
+        t1 = self._starts.pop(name, None)
+        if t1 is None :
+            return None
+        elapsed = (cv.getTickCount() - t1) * self._freq
+        self.add(name, elapsed)
+        return elapsed
+
+    @contextlib.contextmanager
+    def stage(self, name) :
+        self.start(name)
+        try :
+            yield
+        finally :
+            self.stop(name)
+
+    def add(self, name, elapsed) :
+        samples = self._samples.get(name)
+        if samples is None :
+            samples = self._samples[name] = collections.deque(maxlen=self.window)
+        samples.append(elapsed)
+
+    def drop(self, count=1) :
+        self.dropped += count
+
+    def frame(self, fps) :
+        """
+        Count the frames a live source (delivering fps) produced since
+        the previous call and the loop missed : a loop slower than the
+        frame interval drops frames in the driver queue.
+        """
+        now = cv.getTickCount()
+        if self._lastFrame is not None and fps > 0 :
+            periods = (now - self._lastFrame) * fps / cv.getTickFrequency()
+            missed = int(periods + 0.5) - 1
+            if missed > 0 :
+                self.dropped += missed
+        self._lastFrame = now
+
+    @property
+    def stages(self) :
+        return list(self._samples)
+
+    def last(self, name) :
+        samples = self._samples.get(name)
+        return samples[-1] if samples else 0.0
+
+    def stats(self) :
+        """{ stage : { last, mean, p50, p95, p99, max, count } } in ms"""
+        result = collections.OrderedDict()
+        # copies : the stats may be queried from another thread
+        for name, samples in list(self._samples.items()) :
+            values = np.array(list(samples), dtype=np.float64)
+            if not len(values) :
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            result[name] = dict(
+                last=values[-1],
+                mean=values.mean(),
+                p50=p50, p95=p95, p99=p99,
+                max=values.max(),
+                count=len(values),
+            )
+        return result
+
+    def histogram(self, name, bins=10) :
+        """Histogram (counts, edges in ms) of the rolling window of a stage."""
+        samples = self._samples.get(name)
+        if not samples :
+            return np.zeros(bins, dtype=np.int64), np.zeros(bins + 1)
+        return np.histogram(np.array(list(samples)), bins=bins)
+
+    def draw(self, frame, org=(10, 20)) :
+        """Draw the p50/p95 of each stage on frame."""
+        x, y = org
+        lines = [
+            '{:8s} {:6.1f} {:6.1f} ms'.format(name, s['p50'], s['p95'])
+            for name, s in self.stats().items()
+        ]
+        lines.append('dropped  {}'.format(self.dropped))
+        for n, text in enumerate(lines) :
+            cv.putText(
+                frame, text, (x + 1, y + 1 + 15 * n),
+                cv.FONT_HERSHEY_PLAIN, 1.0, (0, 0, 0), 1
+            )
+            cv.putText(
+                frame, text, (x, y + 15 * n),
+                cv.FONT_HERSHEY_PLAIN, 1.0, (0, 215, 255), 1
+            )
+        return frame
+
+# --------------------------------------------------------------------